@@ -0,0 +1,179 @@
+import html
+import os
+import pathlib
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from audit_engine import flag_labels
+from instrumentation import profiler
+from recording_manifest import recording_manifest
+
+# Threads rendering agent reports while the archive is compressed (zlib releases the GIL)
+REPORT_WORKERS = int(os.environ.get("AUDIT_REPORT_WORKERS", min(8, os.cpu_count() or 1)))
+
+REPORT_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: left; }}
+th {{ background: #f0f0f0; }}
+</style></head><body>
+<h1>{title}</h1>
+{body}
+</body></html>
+"""
+
+
+def _escape(values):
+    """HTML-escaped text of an Index of values, vectorized"""
+    text = values.astype('string')
+    if text.str.contains('[&<>"]', regex=True).any():
+        for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;')):
+            text = text.str.replace(char, entity, regex=False)
+    return text
+
+
+def _links(paths):
+    """Links to local files, shown by file name"""
+    return pd.Index([
+        f'<a href="{html.escape(pathlib.Path(path).as_uri())}">{html.escape(os.path.basename(path))}</a>'
+        for path in paths.tolist()
+    ], dtype='string')
+
+
+def _cells(series, render=_escape):
+    """'<td>...</td>' for each value as an object array, rendering each distinct value once"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    cells = ('<td>' + render(pd.Index(uniques)) + '</td>').to_numpy(dtype=object)
+    # The extra last slot serves missing values (code -1)
+    return np.append(cells, '<td></td>')[codes]
+
+
+def html_rows(frame, links=(), markup=()):
+    """One '<tr>...</tr>' string per row, built a column at a time rather than per cell
+
+    Columns named in links hold local file paths and are rendered as links;
+    columns named in markup already hold HTML.
+    """
+    rows = np.full(len(frame), '<tr>', dtype=object)
+    for column in frame.columns:
+        render = (lambda values: values.astype('string')) if column in markup else _links if column in links else _escape
+        rows = rows + _cells(frame[column], render)
+    return rows + '</tr>'
+
+
+def html_table(columns, rows):
+    header = ''.join(f'<th>{html.escape(str(column))}</th>' for column in columns)
+    return f'<table><thead><tr>{header}</tr></thead><tbody>{"".join(rows)}</tbody></table>'
+
+
+def agent_dispositions(dataset):
+    """Calls per agent x disposition from the cube, agents (by code) as rows"""
+    agents = dataset.df['Agent Name'].cat.categories
+    dispositions = dataset.df['Disposition'].cat.categories
+    cube = dataset.cube
+    cube = cube[(cube['agent'].to_numpy() >= 0) & (cube['disposition'].to_numpy() >= 0)]
+    counts = np.bincount(
+        cube['agent'].to_numpy().astype(np.int64) * len(dispositions) + cube['disposition'].to_numpy(),
+        weights=cube['calls'].to_numpy(), minlength=len(agents) * len(dispositions),
+    )
+    return counts.reshape(len(agents), len(dispositions)).astype(np.int64), dispositions
+
+
+def _file_names(agents):
+    """A distinct, filesystem-safe report name per agent, never the bundle's index"""
+    names, used = [], {'index'}
+    for agent in agents:
+        base = re.sub(r'[^\w\- ]+', '_', agent).strip() or 'agent'
+        name, n = base, 1
+        while name.lower() in used:
+            n += 1
+            name = f'{base} ({n})'
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+
+@profiler.timed('agent_reports')
+def build_agent_reports(dataset, path, workers=REPORT_WORKERS, manifest=recording_manifest):
+    """Write a ZIP with an HTML audit report per agent, plus an index of all agents
+
+    Each report holds the agent's Agent Summary row, disposition breakdown and
+    flagged calls, with links to local recordings where the download manifest
+    knows them. The flagged calls are read a chunk at a time, labelled, matched
+    to recordings and rendered to table rows, which are appended to a temporary
+    file per agent; each report then reads back only its own rows. Memory
+    therefore doesn't grow with the number of flagged calls, and streamed
+    uploads, whose flagged calls stay on disk, get reports too.
+    """
+    summary = dataset.agent_summary()
+    agent_codes = summary['Agent Name'].cat.codes.to_numpy()
+    agents = summary['Agent Name'].astype(str).tolist()
+    names = _file_names(agents)
+    summary_rows = html_rows(summary)
+
+    counts, dispositions = agent_dispositions(dataset)
+    n_agents = len(dataset.df['Agent Name'].cat.categories)
+    # The Recording column is shown whenever the manifest has recordings, empty for calls without one
+    links = manifest is not None and len(manifest) > 0
+
+    disposition_cells = _cells(pd.Series(dispositions))
+
+    with tempfile.TemporaryDirectory(prefix='audit-reports-') as parts:
+        flagged = np.zeros(n_agents, dtype=np.int64)
+        for frame in dataset.flagged_frames():
+            calls = flag_labels(frame, dataset.rule_set)
+            if links:
+                calls['Recording'] = manifest.paths_for(frame).to_numpy()
+            columns = calls.columns
+            if not len(frame):
+                continue
+            call_rows = html_rows(calls, links=('Recording',))
+            codes = frame['Agent Name'].cat.codes.to_numpy()
+            order = np.argsort(codes, kind='stable')
+            offsets = np.searchsorted(codes[order], np.arange(n_agents + 1))
+            for code in np.flatnonzero(np.diff(offsets)):
+                with open(os.path.join(parts, f'{code}.html'), 'a', encoding='utf-8') as f:
+                    f.write(''.join(call_rows[order[offsets[code]:offsets[code + 1]]]))
+            flagged += np.diff(offsets)
+
+        def render(i):
+            code = agent_codes[i]
+            agent_counts = counts[code]
+            shares = np.round(100 * agent_counts / max(agent_counts.sum(), 1), 1)
+            ranked = np.argsort(-agent_counts, kind='stable')
+            breakdown = [f'<tr>{disposition_cells[d]}<td>{agent_counts[d]}</td><td>{shares[d]}</td></tr>'
+                         for d in ranked[agent_counts[ranked] > 0]]
+            part = os.path.join(parts, f'{code}.html')
+            agent_calls = ''
+            if os.path.exists(part):
+                with open(part, encoding='utf-8') as f:
+                    agent_calls = f.read()
+            body = (
+                '<h2>Agent Summary</h2>' + html_table(summary.columns, summary_rows[i:i + 1])
+                + '<h2>Disposition Breakdown</h2>' + html_table(['Disposition', 'Calls', 'Share (%)'], breakdown)
+                + f'<h2>Flagged Calls ({flagged[code]:,})</h2>' + html_table(columns, [agent_calls])
+            )
+            return f'{names[i]}.html', REPORT_TEMPLATE.format(title=html.escape(f'Agent Audit - {agents[i]}'), body=body)
+
+        index = summary.assign(**{'Agent Name': [f'<a href="{html.escape(name)}.html">{html.escape(agent)}</a>'
+                                                  for name, agent in zip(names, agents)]})
+
+        # Fast compression: the reports are plain HTML, which shrinks well even at level 1
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as bundle:
+            bundle.writestr('index.html', REPORT_TEMPLATE.format(
+                title='Agent Audit', body=html_table(index.columns, html_rows(index, markup=('Agent Name',)))
+            ))
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for name, report in pool.map(render, range(len(agents))):
+                    bundle.writestr(name, report)
+    return len(agents)
@@ -0,0 +1,283 @@
+"""Decode downloaded recordings and measure what is actually in the audio.
+
+For every recording in the download manifest this computes the true duration,
+the share of silent frames and the longest stretch of speech, caching the
+results by file checksum so each recording is decoded only once. Flag rules
+can then measure the calls with these columns instead of the reported length:
+
+    {"name": "Dead Call Over 15 sec (Audio)", "dispositions": ["Dead Call"],
+     "measure": "Audio Length (Seconds)", "length": "> 15"}
+
+Usage:
+    python audio_analysis.py
+    python audio_analysis.py --workers 8
+"""
+import argparse
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from audit_engine import MEASURE_COLUMNS, call_keys
+from recording_manifest import recording_manifest
+
+# Decoder binary, and the mono sample rate recordings are decoded to (telephone audio is 8 kHz)
+FFMPEG = os.environ.get("AUDIT_FFMPEG", "ffmpeg")
+SAMPLE_RATE = 8000
+
+# Energy framing: 20 ms frames; a frame is speech when louder than SILENCE_DBFS, and
+# pauses shorter than SPEECH_GAP_SECONDS don't split a stretch of speech
+FRAME_SECONDS = 0.02
+SILENCE_DBFS = float(os.environ.get("AUDIT_SILENCE_DBFS", -40))
+SPEECH_GAP_SECONDS = 0.3
+
+# Bytes of decoded audio read from the decoder at a time (a whole number of frames)
+DECODE_BLOCK_BYTES = 2 * int(SAMPLE_RATE * FRAME_SECONDS) * 4096
+
+# Results written to the cache per transaction
+CACHE_BATCH = 500
+
+# Columns added to a call log, and the cache field behind each
+AUDIO_COLUMNS = {
+    'Audio Length (Seconds)': 'duration',
+    'Silence Ratio': 'silence_ratio',
+    'Longest Speech (Seconds)': 'longest_speech',
+}
+# |audio length - reported length|, for rules that check the reported length
+LENGTH_ERROR_COLUMN = 'Length Error (Seconds)'
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def frame_levels(samples, frame=int(SAMPLE_RATE * FRAME_SECONDS)):
+    """Loudness of each whole frame of int16 samples in dBFS"""
+    frames = samples[:len(samples) // frame * frame].reshape(-1, frame).astype(np.float32) / 32768.0
+    power = np.einsum('ij,ij->i', frames, frames) / frame
+    return 10 * np.log10(np.maximum(power, 1e-10))
+
+
+def _runs(mask):
+    """Start positions and lengths of the runs of True in a boolean array"""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def speech_stats(levels, frame_seconds=FRAME_SECONDS, threshold=SILENCE_DBFS, gap_seconds=SPEECH_GAP_SECONDS):
+    """(silence ratio, longest speech in seconds) from per-frame levels"""
+    if not len(levels):
+        return 1.0, 0.0
+    speech = levels > threshold
+    silence_ratio = 1.0 - speech.mean()
+
+    # Bridge short pauses that have speech on both sides
+    starts, lengths = _runs(~speech)
+    inner = (starts > 0) & (starts + lengths < len(speech)) & (lengths * frame_seconds < gap_seconds)
+    if inner.any():
+        fill = np.zeros(len(speech) + 1, dtype=np.int32)
+        np.add.at(fill, starts[inner], 1)
+        np.add.at(fill, starts[inner] + lengths[inner], -1)
+        speech |= np.cumsum(fill[:-1]) > 0
+
+    _, lengths = _runs(speech)
+    return float(silence_ratio), float(lengths.max(initial=0) * frame_seconds)
+
+
+def decode_levels(path):
+    """Decode a recording with ffmpeg and return (duration in seconds, per-frame levels)"""
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    command = [FFMPEG, '-nostdin', '-v', 'error', '-threads', '1', '-i', path,
+               '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1']
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise AudioDecodeError(f"{FFMPEG} was not found; install ffmpeg or set AUDIT_FFMPEG") from None
+
+    levels = []
+    samples = 0
+    tail = b''
+    with process:
+        while True:
+            block = process.stdout.read(DECODE_BLOCK_BYTES)
+            if not block:
+                break
+            block = tail + block
+            usable = len(block) // (2 * frame) * 2 * frame
+            tail = block[usable:]
+            samples += usable // 2
+            levels.append(frame_levels(np.frombuffer(block[:usable], dtype='<i2'), frame))
+        error = process.stderr.read().decode(errors='replace').strip()
+    if process.returncode:
+        raise AudioDecodeError(error or f"{FFMPEG} exited with status {process.returncode}")
+    samples += len(tail) // 2
+    return samples / SAMPLE_RATE, np.concatenate(levels) if levels else np.empty(0)
+
+
+def analyze_file(path):
+    """Audio measurements of one recording, as a dict of the cache fields"""
+    duration, levels = decode_levels(path)
+    silence_ratio, longest_speech = speech_stats(levels)
+    return {'duration': round(duration, 3), 'silence_ratio': round(silence_ratio, 4),
+            'longest_speech': round(longest_speech, 3)}
+
+
+def _analyze(item):
+    """Worker: (sha256, path) -> (sha256, measurements or None, error)"""
+    sha256, path = item
+    try:
+        return sha256, analyze_file(path), ''
+    except (AudioDecodeError, OSError) as e:
+        return sha256, None, str(e)
+
+
+def _connect(manifest):
+    conn = manifest._connect()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS audio (
+            sha256 TEXT PRIMARY KEY,
+            duration REAL, silence_ratio REAL, longest_speech REAL,
+            analyzed_at TEXT NOT NULL, error TEXT NOT NULL
+        )
+    """)
+    return conn
+
+
+def pending_recordings(manifest=recording_manifest, retry_failed=False):
+    """(sha256, path) of each distinct downloaded recording not analyzed yet"""
+    conn = _connect(manifest)
+    try:
+        return conn.execute(f"""
+            SELECT r.sha256, MIN(r.path) FROM recordings r LEFT JOIN audio a ON a.sha256 = r.sha256
+            WHERE a.sha256 IS NULL {"OR a.error != ''" if retry_failed else ''}
+            GROUP BY r.sha256
+        """).fetchall()
+    finally:
+        conn.close()
+
+
+def _store(conn, results):
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    rows = []
+    for sha256, values, error in results:
+        values = values or dict.fromkeys(AUDIO_COLUMNS.values())
+        rows.append((sha256, values['duration'], values['silence_ratio'], values['longest_speech'], now, error))
+    conn.execute("BEGIN")
+    conn.executemany("INSERT OR REPLACE INTO audio VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.execute("COMMIT")
+
+
+def analyze_recordings(manifest=recording_manifest, workers=None, retry_failed=False, progress=None):
+    """Analyze every downloaded recording not in the cache yet, across a process pool
+
+    Returns (recordings analyzed, recordings that failed to decode). Results
+    are committed in batches as they arrive, so an interrupted run keeps its
+    progress.
+    """
+    if shutil.which(FFMPEG) is None:
+        raise AudioDecodeError(f"{FFMPEG} was not found; install ffmpeg or set AUDIT_FFMPEG")
+    pending = pending_recordings(manifest, retry_failed)
+    if not pending:
+        return 0, 0
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+
+    analyzed = failed = 0
+    batch = []
+    conn = _connect(manifest)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # ffmpeg runs in its own process; each worker handles several files per task
+            chunksize = max(1, min(64, len(pending) // (workers * 8)))
+            for result in pool.map(_analyze, pending, chunksize=chunksize):
+                batch.append(result)
+                analyzed += 1
+                failed += result[1] is None
+                if progress is not None:
+                    progress(analyzed, len(pending))
+                if len(batch) >= CACHE_BATCH:
+                    _store(conn, batch)
+                    batch = []
+        if batch:
+            _store(conn, batch)
+    finally:
+        conn.close()
+    _audio_table.cache = None
+    return analyzed, failed
+
+
+def _audio_table(manifest):
+    """Cached measurements joined to call keys, reloaded when the manifest file changes"""
+    stamps = manifest.version
+    cached = _audio_table.cache
+    if cached is not None and cached[0] == (manifest.path, stamps):
+        return cached[1]
+    table = pd.DataFrame(columns=['call_key', *AUDIO_COLUMNS.values()])
+    if os.path.exists(manifest.path):
+        conn = _connect(manifest)
+        try:
+            table = pd.read_sql_query("""
+                SELECT r.call_key, a.duration, a.silence_ratio, a.longest_speech
+                FROM recordings r JOIN audio a ON a.sha256 = r.sha256
+                WHERE r.call_key IS NOT NULL AND a.error = ''
+            """, conn)
+        finally:
+            conn.close()
+    table = table.drop_duplicates('call_key').set_index('call_key')
+    _audio_table.cache = ((manifest.path, stamps), table)
+    return table
+
+
+_audio_table.cache = None
+
+
+def audio_columns(df, manifest=recording_manifest):
+    """Audio measurements for each call of a standardized frame (NaN where not analyzed)"""
+    table = _audio_table(manifest)
+    positions = table.index.get_indexer(call_keys(df)) if len(table) else np.full(len(df), -1)
+    found = positions >= 0
+    columns = {}
+    for column, field in AUDIO_COLUMNS.items():
+        values = np.full(len(df), np.nan)
+        values[found] = table[field].to_numpy(dtype=float)[positions[found]]
+        columns[column] = values
+    reported = df['Recording Length (Seconds)'].to_numpy(dtype=float, na_value=np.nan)
+    columns[LENGTH_ERROR_COLUMN] = np.abs(columns['Audio Length (Seconds)'] - reported)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def with_audio_columns(df, manifest=recording_manifest):
+    """The frame with the audio measurement columns added"""
+    return df.join(audio_columns(df, manifest))
+
+
+# Let flag rules measure calls by their audio
+for _column in [*AUDIO_COLUMNS, LENGTH_ERROR_COLUMN]:
+    MEASURE_COLUMNS[_column] = lambda df, column=_column: audio_columns(df)[column]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--retry-failed', action='store_true', help='decode recordings that failed before again')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        analyzed, failed = analyze_recordings(workers=args.workers, retry_failed=args.retry_failed)
+    except AudioDecodeError as e:
+        print(f"Error analyzing recordings: {str(e)}", file=sys.stderr)
+        return 1
+    print(f"Analyzed {analyzed - failed} of {analyzed} new recordings in {time.perf_counter() - start:.1f}s"
+          f"{f', {failed} could not be decoded' if failed else ''}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
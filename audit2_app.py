@@ -1,30 +1,18 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 import io
-
-# Helper function to safely read CSV files
-def safe_read_csv(uploaded_file):
-    """Safely read CSV file with multiple encoding attempts"""
-    encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-    
-    for encoding in encodings:
-        try:
-            # Reset file pointer to beginning
-            uploaded_file.seek(0)
-            df = pd.read_csv(uploaded_file, encoding=encoding)
-            return df
-        except Exception as e:
-            continue
-    
-    # If all encodings fail, try without specifying encoding
-    try:
-        uploaded_file.seek(0)
-        df = pd.read_csv(uploaded_file)
-        return df
-    except Exception as e:
-        raise Exception(f"Failed to read CSV file with any encoding: {str(e)}")
+import os
+import datetime
+from audit_engine import SORT_COLUMNS, prepare_combined, prepare_dataset, reachability, stream_dataset
+from data_loader import STREAM_THRESHOLD_BYTES, combined_digest, dataset_store, file_digest
+from export_store import EXPORT_FORMATS, export_frames, export_store, write_frames
+from history_store import history_store, running_totals
+from instrumentation import profiler
+from agent_reports import build_agent_reports
+from recording_manifest import recording_manifest
+from charts import disposition_pie
+import audio_analysis  # noqa: F401 (lets flag rules measure calls by their recorded audio)
 
 # Page configuration
 st.set_page_config(
@@ -286,12 +274,20 @@ USERS = {
     "Yehia": "12345resva"
 }
 
+# Users who see the stage timings panel (comma-separated in AUDIT_ADMIN_USERS)
+ADMIN_USERS = set(os.environ.get("AUDIT_ADMIN_USERS", "Abdo").split(","))
+
 # Authentication
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
 
 def logout():
     st.session_state.authenticated = False
+    # Let go of the shared dataset now rather than when the session is discarded
+    if 'dataset_handle' in st.session_state:
+        st.session_state.dataset_handle.release()
+        del st.session_state.dataset_handle
+        st.session_state.current_file_id = None
     st.rerun()
 
 # Login page
@@ -319,6 +315,7 @@ if not st.session_state.authenticated:
         if st.button("Login", key="login_button"):
             if username in USERS and USERS[username] == password:
                 st.session_state.authenticated = True
+                st.session_state.username = username
                 st.rerun()
             else:
                 st.error("Invalid credentials. Please try again.")
@@ -327,532 +324,553 @@ if not st.session_state.authenticated:
     st.stop()
 
 # Main application
-st.markdown('<div class="main-header">RES-VA Call Audit Tool</div>', unsafe_allow_html=True)
+profiler.start_run()
+try:
+    st.markdown('<div class="main-header">RES-VA Call Audit Tool</div>', unsafe_allow_html=True)
 
-# Sidebar
-with st.sidebar:
-    st.markdown("### Navigation")
-    if st.button("Logout"):
-        logout()
-    
-    st.markdown("---")
-    st.markdown("### Upload Data")
-    uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
-    
-    if uploaded_file is not None:
-        st.success("File uploaded successfully!")
-    
-    st.markdown("---")
-    st.markdown("### Filters")
-    
-    # Agent filter
-    if 'agent_options' not in st.session_state:
-        st.session_state.agent_options = ['All users']
-    
-    # Initialize selected_agent in session state if not exists
-    if 'selected_agent' not in st.session_state:
-        st.session_state.selected_agent = 'All users'
-    
-    # Update agent options immediately when data is available
-    if uploaded_file is not None:
-        # Check if we need to reload data
-        file_key = uploaded_file.name + str(uploaded_file.size)
+    # Sidebar
+    with st.sidebar:
+        st.markdown("### Navigation")
+        if st.button("Logout"):
+            logout()
+        
+        st.markdown("---")
+        st.markdown("### Upload Data")
+        uploaded_files = st.file_uploader("Choose CSV files", type="csv", accept_multiple_files=True)
+        # Daily/per-campaign exports are audited together; uploaded_file is None when there are none
+        uploaded_file = uploaded_files or None
         
-        if 'current_file_key' not in st.session_state or st.session_state.current_file_key != file_key:
-            # Load data immediately for agent options
+        dataset = None
+        if uploaded_file is not None:
+            st.success("File uploaded successfully!" if len(uploaded_files) == 1 else f"{len(uploaded_files)} files uploaded successfully!")
+            
+            # Hash each upload once; identical files (same contents) are only read once
+            digests = {f.file_id: st.session_state.get('file_digests', {}).get(f.file_id) or file_digest(f) for f in uploaded_files}
+            st.session_state.file_digests = digests
+            # Sorted by hash, so every session combining the same files builds (and shares) the same dataset
+            sources = sorted({digests[f.file_id]: f for f in uploaded_files}.items(), key=lambda source: source[0])
+            
+            # Swap this session's handle to the shared dataset when the set of files changes.
+            # Sessions uploading the same exports share one preprocessed frame.
+            file_ids = tuple(f.file_id for f in uploaded_files)
+            if st.session_state.get('current_file_id') != file_ids:
+                if 'dataset_handle' in st.session_state:
+                    st.session_state.dataset_handle.release()
+                st.session_state.current_file_id = file_ids
+                if len(sources) == 1:
+                    st.session_state.current_file_key = sources[0][0]
+                    # Large exports are streamed in chunks and only their flagged calls kept
+                    prepare = stream_dataset if sources[0][1].size > STREAM_THRESHOLD_BYTES else prepare_dataset
+                else:
+                    # Several exports are parsed concurrently and repeated calls dropped
+                    st.session_state.current_file_key = combined_digest(digest for digest, _ in sources)
+                    prepare = prepare_combined
+                st.session_state.dataset_handle = dataset_store.acquire(st.session_state.current_file_key, prepare=prepare)
+            
             try:
-                temp_df = safe_read_csv(uploaded_file)
-                if 'Agent Name' in temp_df.columns:
-                    agent_values = temp_df['Agent Name'].astype(str).fillna('Unknown').unique()
-                    agent_names = ['All users'] + sorted([str(x) for x in agent_values if str(x) != 'nan'])
-                    st.session_state.agent_options = agent_names
+                files = [f for _, f in sources]
+                dataset = st.session_state.dataset_handle.get(files[0] if len(files) == 1 else files)
             except Exception as e:
                 st.error(f"Error reading CSV file: {str(e)}")
-                st.session_state.agent_options = ['All users']
-        elif 'original_df' in st.session_state and st.session_state.original_df is not None and 'Agent Name' in st.session_state.original_df.columns:
-            # Use cached data
-            agent_values = st.session_state.original_df['Agent Name'].astype(str).fillna('Unknown').unique()
-            agent_names = ['All users'] + sorted([str(x) for x in agent_values if str(x) != 'nan'])
-            st.session_state.agent_options = agent_names
-    
-    selected_agent = st.selectbox("Select Agent", st.session_state.agent_options, key="agent_selectbox")
-    
-    # Debug: Show available agents
-    if uploaded_file is not None and len(st.session_state.agent_options) > 1:
-        agent_count = len(st.session_state.agent_options) - 1  # Subtract 1 for 'All users'
-        st.caption(f"Available agents: {agent_count} agents loaded")
-    
-    # Update session state when selection changes
-    if selected_agent != st.session_state.selected_agent:
-        st.session_state.selected_agent = selected_agent
-    
-    # Campaign filter
-    if 'campaign_options' not in st.session_state:
-        st.session_state.campaign_options = ['All campaigns']
-    
-    # Initialize selected_campaign in session state if not exists
-    if 'selected_campaign' not in st.session_state:
-        st.session_state.selected_campaign = 'All campaigns'
-    
-    # Update campaign options immediately when data is available
-    if uploaded_file is not None:
-        # Check if we need to reload data
-        file_key = uploaded_file.name + str(uploaded_file.size)
+            if dataset is not None and st.session_state.dataset_handle.prepare is stream_dataset:
+                st.caption("Large file: streamed in chunks, flagged calls are kept on disk")
+            
+            # Keep every processed upload in the history store and fold it into the running
+            # totals (streamed uploads keep no call rows in memory, so they are left out).
+            # The fold runs on a background thread so the page renders without waiting for it.
+            if (dataset is not None and st.session_state.dataset_handle.prepare is not stream_dataset
+                    and st.session_state.get('history_saved_key') != st.session_state.current_file_key):
+                st.session_state.totals_message = None
+                st.session_state.totals_future = None
+                try:
+                    if history_store is not None:
+                        # Stored per export, so a file uploaded again with others isn't saved twice
+                        history_store.append_exports(dataset, [digest for digest, _ in sources])
+                    st.session_state.totals_future = running_totals.fold_async(dataset.df)
+                except Exception as e:
+                    st.warning(f"Could not save upload to history: {str(e)}")
+                st.session_state.history_saved_key = st.session_state.current_file_key
+            totals_future = st.session_state.get('totals_future')
+            if totals_future is not None and totals_future.done():
+                st.session_state.totals_future = None
+                try:
+                    added, skipped = totals_future.result()
+                    st.session_state.totals_message = f"Running totals: {added:,} new calls added, {skipped:,} already counted"
+                except Exception as e:
+                    st.warning(f"Could not add upload to running totals: {str(e)}")
+            if st.session_state.get('totals_future') is not None:
+                st.caption("Running totals: adding this upload in the background")
+            elif st.session_state.get('totals_message'):
+                st.caption(st.session_state.totals_message)
+        elif 'dataset_handle' in st.session_state:
+            # File removed from the uploader: let go of the shared dataset
+            st.session_state.dataset_handle.release()
+            del st.session_state.dataset_handle
+            st.session_state.current_file_id = None
+        source_key = st.session_state.get('current_file_key')
         
-        if 'current_file_key' not in st.session_state or st.session_state.current_file_key != file_key:
-            # Load data immediately for campaign options
+        # Saved history: partitions outside the chosen campaigns and dates are never read.
+        # Running totals: the persisted aggregates of every upload, without call rows.
+        st.markdown("---")
+        st.markdown("### History")
+        sources = ["Uploaded file", "Running totals"]
+        if history_store is not None:
+            sources.insert(1, "Saved history")
+        data_source = st.radio("Data source", sources, key="data_source")
+        use_history = data_source != "Uploaded file"
+        if data_source == "Saved history":
+            today = datetime.date.today()
+            date_range = st.date_input("Upload dates", (today - datetime.timedelta(days=30), today), key="history_dates")
+            history_campaigns = st.multiselect("Campaigns", history_store.campaigns(), key="history_campaigns")
+            start, end = (tuple(date_range) + (None, None))[:2]
+            source_key = ('history', tuple(history_campaigns), start, end, history_store.version)
+            loader = lambda: history_store.load(history_campaigns or None, start=start, end=end)  # noqa: E731
+        elif data_source == "Running totals":
+            source_key = ('running totals', running_totals.version)
+            loader = running_totals.dataset
+        if use_history:
+            dataset = None
             try:
-                temp_df = safe_read_csv(uploaded_file)
-                if 'Current campaign' in temp_df.columns:
-                    campaign_values = temp_df['Current campaign'].astype(str).fillna('Unknown').unique()
-                    campaign_names = ['All campaigns'] + sorted([str(x) for x in campaign_values if str(x) != 'nan'])
-                    st.session_state.campaign_options = campaign_names
+                dataset = dataset_store.get(source_key, loader)
+            except LookupError as e:
+                st.info(str(e))
             except Exception as e:
-                st.error(f"Error reading CSV file: {str(e)}")
-                st.session_state.campaign_options = ['All campaigns']
-        elif 'original_df' in st.session_state and st.session_state.original_df is not None and 'Current campaign' in st.session_state.original_df.columns:
-            # Use cached data
-            campaign_values = st.session_state.original_df['Current campaign'].astype(str).fillna('Unknown').unique()
-            campaign_names = ['All campaigns'] + sorted([str(x) for x in campaign_values if str(x) != 'nan'])
-            st.session_state.campaign_options = campaign_names
-    
-    selected_campaign = st.selectbox("Select Campaign", st.session_state.campaign_options, key="campaign_selectbox")
-    
-    # Update session state when selection changes
-    if selected_campaign != st.session_state.selected_campaign:
-        st.session_state.selected_campaign = selected_campaign
-    
-    # Download button
-    if st.button("Download Agent Audit"):
-        if uploaded_file is not None:
-            st.info("Download functionality would be implemented here")
-        else:
+                st.error(f"Error reading history: {str(e)}")
+        
+        st.markdown("---")
+        st.markdown("### Filters")
+        
+        # Agent filter
+        if 'agent_options' not in st.session_state:
+            st.session_state.agent_options = ['All users']
+        
+        # Initialize selected_agent in session state if not exists
+        if 'selected_agent' not in st.session_state:
+            st.session_state.selected_agent = 'All users'
+        
+        # Campaign filter
+        if 'campaign_options' not in st.session_state:
+            st.session_state.campaign_options = ['All campaigns']
+        
+        # Initialize selected_campaign in session state if not exists
+        if 'selected_campaign' not in st.session_state:
+            st.session_state.selected_campaign = 'All campaigns'
+        
+        # Rebuild filter options only when a different dataset is loaded
+        if (uploaded_file is not None or use_history) and st.session_state.get('options_file_key') != source_key:
+            st.session_state.agent_options = ['All users']
+            st.session_state.campaign_options = ['All campaigns']
+            if dataset is not None:
+                # Agent and campaign columns are categoricals with a sorted vocabulary
+                if 'Agent Name' in dataset.columns:
+                    st.session_state.agent_options = ['All users'] + list(dataset.df['Agent Name'].cat.categories)
+                if 'Current campaign' in dataset.columns:
+                    st.session_state.campaign_options = ['All campaigns'] + list(dataset.df['Current campaign'].cat.categories)
+                st.session_state.options_file_key = source_key
+        
+        # The selectboxes are drawn here by the filtered sections fragment, so changing
+        # a filter only reruns that fragment
+        filters = st.container()
+        
+        # Download button: a ZIP with an HTML report per agent, built on first click and
+        # cached for this dataset until new recordings are linked; clicking doesn't rerun the script
+        if dataset is not None and 'Agent Name' in dataset.columns:
+            st.download_button(
+                label="Download Agent Audit",
+                data=lambda: export_store.open(
+                    (source_key, 'agent reports', recording_manifest.version), '.zip',
+                    lambda path: build_agent_reports(dataset, path)
+                ),
+                file_name="agent_audit.zip",
+                mime="application/zip",
+                on_click="ignore"
+            )
+        elif st.button("Download Agent Audit"):
             st.warning("Please upload a CSV file first")
 
-# Main content
-if uploaded_file is not None:
-    # Check if we need to reload data
-    file_key = uploaded_file.name + str(uploaded_file.size)
-    
-    if 'current_file_key' not in st.session_state or st.session_state.current_file_key != file_key:
-        # Load and process data
-        try:
-            df = safe_read_csv(uploaded_file)
-            st.session_state.df = df
-            st.session_state.original_df = df.copy()
-            st.session_state.current_file_key = file_key
-        except Exception as e:
-            st.error(f"Error reading CSV file: {str(e)}")
-            st.stop()
-    else:
-        # Use cached data
-        df = st.session_state.df.copy()
-        original_df = st.session_state.original_df.copy()
-    
-    # Store original data for agent options
-    original_df = df.copy()
-    
-    # Standardize column names
-    df.columns = df.columns.str.strip()
-    original_df.columns = original_df.columns.str.strip()
-    
-    # Standardize disposition values
-    df['Disposition'] = df['Disposition'].str.strip()
-    original_df['Disposition'] = original_df['Disposition'].str.strip()
-    
-    # Parse recording length
-    df['Recording Length (Seconds)'] = pd.to_numeric(df['Recording Length (Seconds)'], errors='coerce')
-    original_df['Recording Length (Seconds)'] = pd.to_numeric(original_df['Recording Length (Seconds)'], errors='coerce')
-    
-    # Flagging logic
-    df['Flag - Voicemail Over 15 sec'] = ((df['Disposition'] == 'Voicemail') & (df['Recording Length (Seconds)'] > 15)).map({True: 'Check', False: ''})
-    df['Flag - Dead Call Over 15 sec'] = ((df['Disposition'] == 'Dead Call') & (df['Recording Length (Seconds)'] > 15)).map({True: 'Check', False: ''})
-    df['Flag - Decision Maker - NYI Under 10 sec'] = ((df['Disposition'] == 'Decision Maker - NYI') & (df['Recording Length (Seconds)'] < 10)).map({True: 'Check', False: ''})
-    df['Flag - Wrong Number Under 10 sec'] = ((df['Disposition'] == 'Wrong Number') & (df['Recording Length (Seconds)'] < 10)).map({True: 'Check', False: ''})
-    df['Flag - Unknown Under 5 sec'] = ((df['Disposition'] == 'Unknown') & (df['Recording Length (Seconds)'] < 5)).map({True: 'Check', False: ''})
-    
-    # New flag for potential release/tech issue
-    df['Flag - Potential Release/Tech Issue'] = ((df['Disposition'] == 'Dead Call') | (df['Disposition'] == 'Unknown')).map({True: 'Check', False: ''})
-    
-    # Also add flag columns to original_df for Agent Summary
-    original_df['Flag - Voicemail Over 15 sec'] = ((original_df['Disposition'] == 'Voicemail') & (original_df['Recording Length (Seconds)'] > 15)).map({True: 'Check', False: ''})
-    original_df['Flag - Dead Call Over 15 sec'] = ((original_df['Disposition'] == 'Dead Call') & (original_df['Recording Length (Seconds)'] > 15)).map({True: 'Check', False: ''})
-    original_df['Flag - Decision Maker - NYI Under 10 sec'] = ((original_df['Disposition'] == 'Decision Maker - NYI') & (original_df['Recording Length (Seconds)'] < 10)).map({True: 'Check', False: ''})
-    original_df['Flag - Wrong Number Under 10 sec'] = ((original_df['Disposition'] == 'Wrong Number') & (original_df['Recording Length (Seconds)'] < 10)).map({True: 'Check', False: ''})
-    original_df['Flag - Unknown Under 5 sec'] = ((original_df['Disposition'] == 'Unknown') & (original_df['Recording Length (Seconds)'] < 5)).map({True: 'Check', False: ''})
-    original_df['Flag - Potential Release/Tech Issue'] = ((original_df['Disposition'] == 'Dead Call') | (original_df['Disposition'] == 'Unknown')).map({True: 'Check', False: ''})
-    
-    # Add call duration label
-    df['Call Duration Label'] = pd.cut(df['Recording Length (Seconds)'], 
-                                      bins=[0, 30, 60, float('inf')], 
-                                      labels=['Very Short', 'Short', 'OK'])
-    original_df['Call Duration Label'] = pd.cut(original_df['Recording Length (Seconds)'], 
-                                               bins=[0, 30, 60, float('inf')], 
-                                               labels=['Very Short', 'Short', 'OK'])
-    
-    # Format recording length
-    def format_duration(seconds):
-        if pd.isna(seconds):
-            return "0:00"
-        minutes = int(seconds // 60)
-        secs = int(seconds % 60)
-        return f"{minutes}:{secs:02d}"
-    
-    df['Recording Length (Formatted)'] = df['Recording Length (Seconds)'].apply(format_duration)
-    original_df['Recording Length (Formatted)'] = original_df['Recording Length (Seconds)'].apply(format_duration)
-    
-    # Create filtered dataframe for flagged calls only
-    filtered_df = df.copy()
-    
-    # Apply filters only to the filtered dataframe for flagged calls
-    if st.session_state.selected_agent and st.session_state.selected_agent != 'All users':
-        filtered_df = filtered_df[filtered_df['Agent Name'] == st.session_state.selected_agent]
-    
-    if st.session_state.selected_campaign and st.session_state.selected_campaign != 'All campaigns':
-        filtered_df = filtered_df[filtered_df['Current campaign'] == st.session_state.selected_campaign]
-    
-    # Overall Summary
-    st.markdown('<div class="overall-summary-header">Overall Summary</div>', unsafe_allow_html=True)
-    
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        voicemail_count = len(df[df['Flag - Voicemail Over 15 sec'] == 'Check'])
-        st.markdown(f'''
-        <div class="metric-card-voicemail">
-            <div style="font-size: 1.5rem; font-weight: bold;">{voicemail_count}</div>
-            <div>Voicemail Over 15s</div>
-        </div>
-        ''', unsafe_allow_html=True)
-    
-    with col2:
-        dead_count = len(df[df['Flag - Dead Call Over 15 sec'] == 'Check'])
-        st.markdown(f'''
-        <div class="metric-card-dead">
-            <div style="font-size: 1.5rem; font-weight: bold;">{dead_count}</div>
-            <div>Dead Calls Over 15s</div>
-        </div>
-        ''', unsafe_allow_html=True)
-    
-    with col3:
-        decision_count = len(df[df['Flag - Decision Maker - NYI Under 10 sec'] == 'Check'])
-        st.markdown(f'''
-        <div class="metric-card-decision">
-            <div style="font-size: 1.5rem; font-weight: bold;">{decision_count}</div>
-            <div>Decision Maker Under 10s</div>
-        </div>
-        ''', unsafe_allow_html=True)
-    
-    with col4:
-        total_flagged = len(df[df[['Flag - Voicemail Over 15 sec', 'Flag - Dead Call Over 15 sec', 
-                                  'Flag - Decision Maker - NYI Under 10 sec', 'Flag - Wrong Number Under 10 sec', 
-                                  'Flag - Unknown Under 5 sec']].eq('Check').any(axis=1)])
-        st.markdown(f'''
-        <div class="metric-card-total">
-            <div style="font-size: 1.5rem; font-weight: bold;">{total_flagged}</div>
-            <div>Total Flagged</div>
-        </div>
-        ''', unsafe_allow_html=True)
-    
-    # Agent Summary - Issues Overview
-    st.markdown('<div class="section-header">Agent Summary - Issues Overview</div>', unsafe_allow_html=True)
-    
-    if 'Agent Name' in original_df.columns:
-        # Always show summary for all agents (use original_df)
-        agent_summary = original_df.groupby('Agent Name').agg({
-            'Flag - Voicemail Over 15 sec': lambda x: (x == 'Check').sum(),
-            'Flag - Dead Call Over 15 sec': lambda x: (x == 'Check').sum(),
-            'Flag - Unknown Under 5 sec': lambda x: (x == 'Check').sum(),
-        }).reset_index()
-        
-        # Calculate Decision Maker - NYI and Wrong Number totals per agent (for internal calculation only)
-        decision_maker_nyi_counts = original_df.groupby('Agent Name')['Disposition'].apply(
-            lambda x: (x == 'Decision Maker - NYI').sum()
-        )
-        wrong_number_counts = original_df.groupby('Agent Name')['Disposition'].apply(
-            lambda x: (x == 'Wrong Number').sum()
-        )
-        dead_call_counts = original_df.groupby('Agent Name')['Disposition'].apply(
-            lambda x: (x == 'Dead Call').sum()
-        )
-        unknown_counts = original_df.groupby('Agent Name')['Disposition'].apply(
-            lambda x: (x == 'Unknown').sum()
-        )
-        
-        # Calculate potential release/tech issue flag
-        agent_summary['Potential Release/Tech Issue'] = agent_summary.apply(
-            lambda row: 'Yes' if (decision_maker_nyi_counts.get(row['Agent Name'], 0) + wrong_number_counts.get(row['Agent Name'], 0)) < (dead_call_counts.get(row['Agent Name'], 0) + unknown_counts.get(row['Agent Name'], 0)) else 'No', axis=1
-        )
-        
-        st.dataframe(agent_summary, use_container_width=True)
-    
+    # Filter-dependent sections
+    FLAGGED_PAGE_SIZES = [50, 100, 250, 500]
 
-    
-    # Flagged Calls
-    st.markdown('<div class="section-header">Flagged Calls</div>', unsafe_allow_html=True)
-    
-    # Get flagged calls from filtered data
-    flagged_calls = filtered_df[filtered_df[['Flag - Voicemail Over 15 sec', 'Flag - Dead Call Over 15 sec', 
-                           'Flag - Decision Maker - NYI Under 10 sec', 'Flag - Wrong Number Under 10 sec', 
-                           'Flag - Unknown Under 5 sec']].eq('Check').any(axis=1)]
-    
-    if not flagged_calls.empty:
-        col1, col2 = st.columns([1, 1])
+
+    def filter_widgets(data_loaded):
+        """Agent and campaign selectboxes; returns the selected (agent, campaign)"""
+        selected_agent = st.selectbox("Select Agent", st.session_state.agent_options, key="agent_selectbox")
         
-        with col1:
-            # Display flagged calls table with specific columns
+        # Debug: Show available agents
+        if data_loaded and len(st.session_state.agent_options) > 1:
+            agent_count = len(st.session_state.agent_options) - 1  # Subtract 1 for 'All users'
+            st.caption(f"Available agents: {agent_count} agents loaded")
+        
+        # Update session state when selection changes
+        if selected_agent != st.session_state.selected_agent:
+            st.session_state.selected_agent = selected_agent
+        
+        selected_campaign = st.selectbox("Select Campaign", st.session_state.campaign_options, key="campaign_selectbox")
+        
+        # Update session state when selection changes
+        if selected_campaign != st.session_state.selected_campaign:
+            st.session_state.selected_campaign = selected_campaign
+        
+        return selected_agent, selected_campaign
+
+
+    @st.fragment
+    @profiler.timed('flagged_table')
+    def flagged_calls_table(dataset, agent_filter, campaign_filter):
+        """One page of the flagged calls, sorted and searched on the server
+        
+        Only the visible page is sent to the browser, and paging, sorting and
+        searching rerun just this fragment. In-memory datasets sort with orders
+        kept per column; streamed ones read the page from their spill file.
+        """
+        search_col, sort_col, order_col = st.columns([2, 2, 1])
+        with search_col:
+            phone = st.text_input("Search phone number", key="flagged_phone").strip()
+        with sort_col:
+            sort_label = st.selectbox("Sort by", ['File order'] + list(SORT_COLUMNS), key="flagged_sort")
+        with order_col:
+            descending = st.checkbox("Descending", key="flagged_descending")
+        
+        sort_by = SORT_COLUMNS.get(sort_label)
+        total = dataset.flagged_total(agent_filter, campaign_filter, phone=phone or None)
+        
+        # Start from the first page whenever the calls being paged through change
+        query = (id(dataset), agent_filter, campaign_filter, phone, sort_label, descending)
+        if st.session_state.get('flagged_query') != query:
+            st.session_state.flagged_query = query
+            st.session_state.flagged_page = 1
+        
+        table = st.container()
+        size_col, page_col = st.columns([1, 1])
+        with size_col:
+            page_size = st.selectbox("Rows per page", FLAGGED_PAGE_SIZES, index=1, key="flagged_page_size")
+        pages = max(1, -(-total // page_size))
+        if st.session_state.get('flagged_page', 1) > pages:
+            st.session_state.flagged_page = pages
+        with page_col:
+            page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, step=1, key="flagged_page")
+        
+        start = (page - 1) * page_size
+        with table:
+            if not total:
+                st.info("No flagged calls match this phone number")
+                return
             display_columns = ['Agent Name', 'Disposition', 'Recording Length (Formatted)', 'Phone Number']
-            available_columns = [col for col in display_columns if col in flagged_calls.columns]
+            flagged_table = dataset.flagged_page(agent_filter, campaign_filter, sort_by=sort_by, descending=descending,
+                                                 phone=phone or None, start=start, size=page_size, columns=display_columns)
             
-            if available_columns:
-                st.dataframe(flagged_calls[available_columns], use_container_width=True)
+            if len(flagged_table.columns):
+                st.dataframe(flagged_table, use_container_width=True)
+            st.caption(f"Calls {start + 1:,}-{start + len(flagged_table):,} of {total:,}")
+
+
+    @st.fragment
+    @profiler.timed('filtered_sections')
+    def filtered_sections(dataset, source_key, filters):
+        """Flagged Calls, Export Data and Campaign Summary for the selected agent and campaign
         
-        with col2:
-            # Pie chart - Show only specific dispositions for filtered data
-            # Filter to only show the 4 specific dispositions
+        Runs as a fragment: its inputs are the dataset and the filter selectboxes it
+        draws into the sidebar, so changing a filter reruns only these sections and
+        not the summaries of the whole dataset above them.
+        """
+        with filters:
+            selected_agent, selected_campaign = filter_widgets(True)
+        
+        df = dataset.df
+        agent_filter = None if selected_agent in (None, 'All users') else selected_agent
+        campaign_filter = None if selected_campaign in (None, 'All campaigns') else selected_campaign
+        
+        # Flagged Calls
+        st.markdown('<div class="section-header">Flagged Calls</div>', unsafe_allow_html=True)
+        
+        # Get flagged calls from filtered data. Running totals count flagged calls
+        # without keeping them, so there can be counts but no calls to list.
+        flagged_total = dataset.flagged_total(agent_filter, campaign_filter)
+        flagged_counted = dataset.flag_counts(agent_filter, campaign_filter)['Total Flagged']
+        
+        if flagged_total or flagged_counted:
+            col1, col2 = st.columns([1, 1])
+            
+            with col1:
+                # Display flagged calls table with specific columns, a page at a time
+                if flagged_total:
+                    flagged_calls_table(dataset, agent_filter, campaign_filter)
+                else:
+                    st.info("Only counts are kept for these calls, so the flagged calls can't be listed here")
+            
+            with col2:
+                # Pie chart - Show only specific dispositions for filtered data
+                # Filter to only show the 4 specific dispositions
+                specific_dispositions = ['Decision Maker - NYI', 'Dead Call', 'Wrong Number', 'Unknown']
+                disposition_counts = dataset.disposition_counts(specific_dispositions, agent_filter, campaign_filter)
+                
+                # Built from the counts only and memoized on them, so going back to a filter
+                # reuses the figure
+                fig_pie = disposition_pie(disposition_counts, "Total Calls by Disposition")
+                st.plotly_chart(fig_pie, use_container_width=True, key="pie_chart_1")
+            
+            # Disposition Summary
+            
+            # Calculate totals for the 4 specific dispositions from filtered data
             specific_dispositions = ['Decision Maker - NYI', 'Dead Call', 'Wrong Number', 'Unknown']
-            pie_chart_df = filtered_df[filtered_df['Disposition'].isin(specific_dispositions)]
-            disposition_counts = pie_chart_df['Disposition'].value_counts()
+            disposition_totals = dataset.disposition_counts(specific_dispositions, agent_filter, campaign_filter).to_dict()
             
-            color_map = {
-                'Decision Maker - NYI': '#4C84FF',  
-                'Unknown': '#ca1b1b',              
-                'Wrong Number': '#F9C74F',          
-                'Dead Call': '#FF6B6B'             
-            }
+            # Create summary cards
+            col1, col2, col3, col4 = st.columns(4)
             
-            # Add counts to disposition names for the legend
-            # Reorder to ensure Dead Call and Unknown are adjacent
-            disposition_counts_with_counts = {}
+            with col1:
+                st.markdown(f'''
+                <div class="metric-card-total">
+                    <div style="font-size: 1.5rem; font-weight: bold;">{disposition_totals.get('Decision Maker - NYI', 0)}</div>
+                    <div>Decision Maker - NYI</div>
+                </div>
+                ''', unsafe_allow_html=True)
             
-            # Define the order we want: Dead Call and Unknown should be adjacent
-            desired_order = ['Decision Maker - NYI', 'Wrong Number', 'Dead Call', 'Unknown']
+            with col2:
+                st.markdown(f'''
+                <div class="metric-card-dead">
+                    <div style="font-size: 1.5rem; font-weight: bold;">{disposition_totals.get('Dead Call', 0)}</div>
+                    <div>Dead Call</div>
+                </div>
+                ''', unsafe_allow_html=True)
             
-            # Add items in the desired order
-            for disposition in desired_order:
-                if disposition in disposition_counts:
-                    disposition_counts_with_counts[f"{disposition} ({disposition_counts[disposition]})"] = disposition_counts[disposition]
+            with col3:
+                st.markdown(f'''
+                <div class="metric-card-decision">
+                    <div style="font-size: 1.5rem; font-weight: bold;">{disposition_totals.get('Wrong Number', 0)}</div>
+                    <div>Wrong Number</div>
+                </div>
+                ''', unsafe_allow_html=True)
             
-            # Add any remaining dispositions that weren't in our desired order
-            for disposition, count in disposition_counts.items():
-                if disposition not in desired_order:
-                    disposition_counts_with_counts[f"{disposition} ({count})"] = count
+            with col4:
+                st.markdown(f'''
+                <div class="metric-card-voicemail">
+                    <div style="font-size: 1.5rem; font-weight: bold;">{disposition_totals.get('Unknown', 0)}</div>
+                    <div>Unknown</div>
+                </div>
+                ''', unsafe_allow_html=True)
             
-            fig_pie = px.pie(
-                values=list(disposition_counts_with_counts.values()),
-                names=list(disposition_counts_with_counts.keys()),
-                title="Total Calls by Disposition",
-                color_discrete_map=color_map
-            )
-            # Force the exact order we want
-            fig_pie.update_traces(
-                marker_colors=[color_map.get(name.split(' (')[0], '#000000') for name in disposition_counts_with_counts.keys()]
-            )
-            fig_pie.update_layout(
-                height=400,
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                font=dict(color='#E0E0E0')
+            # Aya's Idea component
+            st.markdown('''
+            <div class="aya-idea">
+                💡 Aya's Idea ↑
+            </div>
+            ''', unsafe_allow_html=True)
+        
+        # Export Data
+        st.markdown('<div class="section-header">Export Data</div>', unsafe_allow_html=True)
+        
+        if flagged_total:
+            # The file is written in chunks on first click, then served from the export
+            # cache for the same data and filters; clicking doesn't rerun the script
+            export_format = st.selectbox("Format", list(EXPORT_FORMATS), key="export_format")
+            suffix, mime = EXPORT_FORMATS[export_format]
+            export_key = (source_key, 'flagged', agent_filter, campaign_filter, export_format)
+            st.download_button(
+                label="Download Flagged Calls",
+                data=lambda: export_store.open(export_key, suffix, lambda path: write_frames(
+                    export_frames(dataset, agent_filter, campaign_filter), path, export_format
+                )),
+                file_name=f"flagged_calls{suffix}",
+                mime=mime,
+                on_click="ignore"
             )
-            st.plotly_chart(fig_pie, use_container_width=True, key="pie_chart_1")
+        elif flagged_counted:
+            st.info("Only counts are kept for these calls, so there are no flagged calls to export")
+        else:
+            st.warning("No flagged calls to export")
         
-        # Disposition Summary
+        if 'Current campaign' in df.columns:
+            st.markdown("---")
+            campaign_summary(dataset, agent_filter, campaign_filter)
+
+
+    @st.fragment
+    @profiler.timed('campaign_section')
+    def campaign_summary(dataset, agent_filter, campaign_filter):
+        """Collapsible Campaign Summary, computed only while it is open"""
+        # Opening or closing the expander reruns just this fragment
+        section = st.expander("📊 Campaign Summary - Disposition Distribution", expanded=False,
+                              key="campaign_summary_expander", on_change="rerun")
+        if not section.open:
+            return
         
-        # Calculate totals for the 4 specific dispositions from filtered data
-        specific_dispositions = ['Decision Maker - NYI', 'Dead Call', 'Wrong Number', 'Unknown']
-        disposition_totals = {}
+        with section:
+            st.markdown('<div class="section-header">Campaign Summary - Disposition Distribution</div>', unsafe_allow_html=True)
+            
+            # Filter to only show the 5 specific dispositions for selected campaign (including Voicemail)
+            specific_dispositions = ['Decision Maker - NYI', 'Dead Call', 'Wrong Number', 'Unknown', 'Voicemail']
+            disposition_counts = dataset.disposition_counts(specific_dispositions, agent_filter, campaign_filter)
+            
+            fig_campaign_disposition_pie = disposition_pie(disposition_counts, "Total Calls by Disposition (Campaign Filtered)")
+            st.plotly_chart(fig_campaign_disposition_pie, use_container_width=True, key="pie_chart_2")
+            
+            # Campaign Reachability Analysis
+            st.markdown('<div class="section-header">Campaign Reachability Analysis</div>', unsafe_allow_html=True)
+            
+            # Calculate the metrics
+            dead_calls = disposition_counts.get('Dead Call', 0)
+            unknown_calls = disposition_counts.get('Unknown', 0)
+            voicemail_calls = disposition_counts.get('Voicemail', 0)
+            decision_maker = disposition_counts.get('Decision Maker - NYI', 0)
+            wrong_number = disposition_counts.get('Wrong Number', 0)
+            
+            # Determine reachability status
+            verdict, low_reachability_total, good_reachability_total = reachability(disposition_counts)
+            if verdict == 'Low':
+                status = "⚠️ LOW REACHABILITY"
+                status_color = "#FF6B6B"
+                message = f"""This campaign shows low reachability.<br><br>
+Low Engagement ({low_reachability_total:,} calls):<br>
+• Dead Calls: {dead_calls:,}<br>
+• Unknown: {unknown_calls:,}<br>
+• Voicemails: {voicemail_calls:,}<br><br>
+Good Engagement ({good_reachability_total:,} calls):<br>
+• Decision Makers: {decision_maker:,}<br>
+• Wrong Numbers: {wrong_number:,}<br><br>
+Low engagement exceeds good engagement — action may be needed to improve contact rates."""
+            else:
+                status = "✅ GOOD REACHABILITY"
+                status_color = "#4C84FF"
+                message = f"""This campaign shows good reachability.<br><br>
+Good Engagement ({good_reachability_total:,} calls):<br>
+• Decision Makers: {decision_maker:,}<br>
+• Wrong Numbers: {wrong_number:,}<br><br>
+Low Engagement ({low_reachability_total:,} calls):<br>
+• Dead Calls: {dead_calls:,}<br>
+• Unknown: {unknown_calls:,}<br>
+• Voicemails: {voicemail_calls:,}<br><br>
+Good engagement exceeds low engagement — campaign is performing well."""
+            
+            # Display the analysis
+            st.markdown(f'''
+            <div style="
+                background: linear-gradient(135deg, {status_color}20 0%, {status_color}10 100%);
+                border: 2px solid {status_color};
+                border-radius: 12px;
+                padding: 1.5rem;
+                margin: 1rem 0;
+                color: #E0E0E0;
+            ">
+                <div style="
+                    font-size: 1.5rem;
+                    font-weight: bold;
+                    color: {status_color};
+                    margin-bottom: 1rem;
+                    text-align: center;
+                ">
+                    {status}
+                </div>
+                <div style="
+                    font-size: 1rem;
+                    line-height: 1.6;
+                    text-align: left;
+                ">
+                    {message}
+                </div>
+            </div>
+            ''', unsafe_allow_html=True)
+
+
+    # Main content
+    if uploaded_file is not None or use_history:
+        if dataset is None:
+            with filters:
+                filter_widgets(False)
+            st.stop()
+        
+        # One preprocessed dataset shared through the dataset store. Counts come from its
+        # pre-aggregated cube; row views select positions and never copy the base frame.
+        df = dataset.df
+        overall_counts = dataset.flag_counts()
         
-        for disposition in specific_dispositions:
-            disposition_totals[disposition] = len(filtered_df[filtered_df['Disposition'] == disposition])
+        # Overall Summary
+        st.markdown('<div class="overall-summary-header">Overall Summary</div>', unsafe_allow_html=True)
         
-        # Create summary cards
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
+            voicemail_count = overall_counts['Voicemail Over 15 sec']
             st.markdown(f'''
-            <div class="metric-card-total">
-                <div style="font-size: 1.5rem; font-weight: bold;">{disposition_totals.get('Decision Maker - NYI', 0)}</div>
-                <div>Decision Maker - NYI</div>
+            <div class="metric-card-voicemail">
+                <div style="font-size: 1.5rem; font-weight: bold;">{voicemail_count}</div>
+                <div>Voicemail Over 15s</div>
             </div>
             ''', unsafe_allow_html=True)
         
         with col2:
+            dead_count = overall_counts['Dead Call Over 15 sec']
             st.markdown(f'''
             <div class="metric-card-dead">
-                <div style="font-size: 1.5rem; font-weight: bold;">{disposition_totals.get('Dead Call', 0)}</div>
-                <div>Dead Call</div>
+                <div style="font-size: 1.5rem; font-weight: bold;">{dead_count}</div>
+                <div>Dead Calls Over 15s</div>
             </div>
             ''', unsafe_allow_html=True)
         
         with col3:
+            decision_count = overall_counts['Decision Maker - NYI Under 10 sec']
             st.markdown(f'''
             <div class="metric-card-decision">
-                <div style="font-size: 1.5rem; font-weight: bold;">{disposition_totals.get('Wrong Number', 0)}</div>
-                <div>Wrong Number</div>
+                <div style="font-size: 1.5rem; font-weight: bold;">{decision_count}</div>
+                <div>Decision Maker Under 10s</div>
             </div>
             ''', unsafe_allow_html=True)
         
         with col4:
+            total_flagged = overall_counts['Total Flagged']
             st.markdown(f'''
-            <div class="metric-card-voicemail">
-                <div style="font-size: 1.5rem; font-weight: bold;">{disposition_totals.get('Unknown', 0)}</div>
-                <div>Unknown</div>
+            <div class="metric-card-total">
+                <div style="font-size: 1.5rem; font-weight: bold;">{total_flagged}</div>
+                <div>Total Flagged</div>
             </div>
             ''', unsafe_allow_html=True)
         
-        # Aya's Idea component
-        st.markdown('''
-        <div class="aya-idea">
-            💡 Aya's Idea ↑
-        </div>
-        ''', unsafe_allow_html=True)
-    
-    # Export Data
-    st.markdown('<div class="section-header">Export Data</div>', unsafe_allow_html=True)
-    
-    if st.button("Download Flagged Calls CSV"):
-        if not flagged_calls.empty:
-            csv = flagged_calls.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name="flagged_calls.csv",
-                mime="text/csv"
-            )
-        else:
-            st.warning("No flagged calls to export")
-
-else:
-    st.info("Please upload a CSV file to begin analysis.")
-
-# Campaign Summary - Collapsible Section (at the end)
-if uploaded_file is not None and 'Current campaign' in original_df.columns:
-    st.markdown("---")
-    
-    # Collapsible section
-    with st.expander("📊 Campaign Summary - Disposition Distribution", expanded=False):
-        st.markdown('<div class="section-header">Campaign Summary - Disposition Distribution</div>', unsafe_allow_html=True)
-        
-        # Filter to only show the 5 specific dispositions for selected campaign (including Voicemail)
-        specific_dispositions = ['Decision Maker - NYI', 'Dead Call', 'Wrong Number', 'Unknown', 'Voicemail']
-        campaign_disposition_df = filtered_df[filtered_df['Disposition'].isin(specific_dispositions)]
-        disposition_counts = campaign_disposition_df['Disposition'].value_counts()
-        
-        color_map = {
-            'Decision Maker - NYI': '#4C84FF',
-            'Unknown': '#ca1b1b',
-            'Wrong Number': '#F9C74F',
-            'Dead Call': '#FF6B6B',
-            'Voicemail': '#9B59B6'
-        }
+        # Agent Summary - Issues Overview
+        st.markdown('<div class="section-header">Agent Summary - Issues Overview</div>', unsafe_allow_html=True)
         
-        # Add counts to disposition names for the legend
-        # Reorder to ensure Dead Call and Unknown are adjacent
-        disposition_counts_with_counts = {}
-        
-        # Define the order we want: Dead Call and Unknown should be adjacent
-        desired_order = ['Decision Maker - NYI', 'Wrong Number', 'Dead Call', 'Unknown', 'Voicemail']
-        
-        # Add items in the desired order
-        for disposition in desired_order:
-            if disposition in disposition_counts:
-                disposition_counts_with_counts[f"{disposition} ({disposition_counts[disposition]})"] = disposition_counts[disposition]
-        
-        # Add any remaining dispositions that weren't in our desired order
-        for disposition, count in disposition_counts.items():
-            if disposition not in desired_order:
-                disposition_counts_with_counts[f"{disposition} ({count})"] = count
-        
-        fig_campaign_disposition_pie = px.pie(
-            values=list(disposition_counts_with_counts.values()),
-            names=list(disposition_counts_with_counts.keys()),
-            title="Total Calls by Disposition (Campaign Filtered)",
-            color_discrete_map=color_map
-        )
-        # Force the exact order we want
-        fig_campaign_disposition_pie.update_traces(
-            marker_colors=[color_map.get(name.split(' (')[0], '#000000') for name in disposition_counts_with_counts.keys()]
-        )
-        fig_campaign_disposition_pie.update_layout(
-            height=400,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#E0E0E0')
-        )
-        st.plotly_chart(fig_campaign_disposition_pie, use_container_width=True, key="pie_chart_2")
-        
-        # Campaign Reachability Analysis
-        st.markdown('<div class="section-header">Campaign Reachability Analysis</div>', unsafe_allow_html=True)
-        
-        # Calculate the metrics
-        dead_calls = disposition_counts.get('Dead Call', 0)
-        unknown_calls = disposition_counts.get('Unknown', 0)
-        voicemail_calls = disposition_counts.get('Voicemail', 0)
-        decision_maker = disposition_counts.get('Decision Maker - NYI', 0)
-        wrong_number = disposition_counts.get('Wrong Number', 0)
-        
-        # Calculate totals
-        low_reachability_total = dead_calls + unknown_calls + voicemail_calls
-        good_reachability_total = decision_maker + wrong_number
-        
-        # Determine reachability status
-        if low_reachability_total > good_reachability_total:
-            status = "⚠️ LOW REACHABILITY"
-            status_color = "#FF6B6B"
-            message = f"""This campaign shows low reachability.<br><br>
-Low Engagement ({low_reachability_total:,} calls):<br>
-• Dead Calls: {dead_calls:,}<br>
-• Unknown: {unknown_calls:,}<br>
-• Voicemails: {voicemail_calls:,}<br><br>
-Good Engagement ({good_reachability_total:,} calls):<br>
-• Decision Makers: {decision_maker:,}<br>
-• Wrong Numbers: {wrong_number:,}<br><br>
-Low engagement exceeds good engagement — action may be needed to improve contact rates."""
-        else:
-            status = "✅ GOOD REACHABILITY"
-            status_color = "#4C84FF"
-            message = f"""This campaign shows good reachability.<br><br>
-Good Engagement ({good_reachability_total:,} calls):<br>
-• Decision Makers: {decision_maker:,}<br>
-• Wrong Numbers: {wrong_number:,}<br><br>
-Low Engagement ({low_reachability_total:,} calls):<br>
-• Dead Calls: {dead_calls:,}<br>
-• Unknown: {unknown_calls:,}<br>
-• Voicemails: {voicemail_calls:,}<br><br>
-Good engagement exceeds low engagement — campaign is performing well."""
+        if 'Agent Name' in df.columns:
+            # Always show summary for all agents (unfiltered); computed once per dataset
+            agent_summary = dataset.agent_summary()
+            
+            st.dataframe(agent_summary, use_container_width=True)
         
-        # Display the analysis
-        st.markdown(f'''
-        <div style="
-            background: linear-gradient(135deg, {status_color}20 0%, {status_color}10 100%);
-            border: 2px solid {status_color};
-            border-radius: 12px;
-            padding: 1.5rem;
-            margin: 1rem 0;
-            color: #E0E0E0;
-        ">
-            <div style="
-                font-size: 1.5rem;
-                font-weight: bold;
-                color: {status_color};
-                margin-bottom: 1rem;
-                text-align: center;
-            ">
-                {status}
-            </div>
-            <div style="
-                font-size: 1rem;
-                line-height: 1.6;
-                text-align: left;
-            ">
-                {message}
+
+        # Filters only apply to the flagged calls and campaign sections
+        filtered_sections(dataset, source_key, filters)
+        
+        if 'Current campaign' in df.columns:
+            # Credits Footer
+            st.markdown('''
+            <div class="footer">
+                Developed by <a href="https://t.me/Mohmed_abdo" target="_blank" class="footer-link">Mohamed Abdo</a> © 2025
             </div>
-        </div>
-        ''', unsafe_allow_html=True)
-    
-    # Credits Footer
-    st.markdown('''
-    <div class="footer">
-        Developed by <a href="https://t.me/Mohmed_abdo" target="_blank" class="footer-link">Mohamed Abdo</a> © 2025
-    </div>
-    ''', unsafe_allow_html=True)
\ No newline at end of file
+            ''', unsafe_allow_html=True)
+
+    else:
+        with filters:
+            filter_widgets(False)
+        st.info("Please upload a CSV file to begin analysis.")
+
+    # Stage timings (admin only)
+    if st.session_state.get('username') in ADMIN_USERS:
+        with st.sidebar:
+            st.markdown("---")
+            st.markdown("### Stage Timings")
+            # Process-wide switch, which another admin may have flipped; recording is
+            # close to free while it is off
+            st.session_state.profile_toggle = profiler.enabled
+            st.toggle("Record stage timings", key="profile_toggle",
+                      on_change=lambda: profiler.enable(st.session_state.profile_toggle))
+            if profiler.enabled:
+                run_samples = profiler.run_samples()
+                if run_samples:
+                    st.caption("This rerun")
+                    st.dataframe(pd.DataFrame(run_samples), hide_index=True, width="stretch")
+                summary = profiler.summary()
+                if summary:
+                    st.caption(f"Recent reruns (p50/p95 per stage), also logged to {profiler.log_path}")
+                    st.dataframe(pd.DataFrame(summary), hide_index=True, width="stretch")
+                else:
+                    st.caption("Timings are recorded from the next rerun on")
+finally:
+    profiler.finish_run()
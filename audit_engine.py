@@ -0,0 +1,905 @@
+import json
+import os
+import re
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from data_loader import SpillFile
+from instrumentation import profiler
+
+# Flag rules are declared in JSON; point AUDIT_FLAG_RULES at another file to override
+FLAG_RULES_PATH = os.environ.get(
+    "AUDIT_FLAG_RULES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "flag_rules.json"),
+)
+
+_LENGTH_CONDITION = re.compile(r"^\s*(>=|<=|>|<)\s*(\d+(?:\.\d+)?)\s*$")
+_OPERATORS = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal}
+
+
+def _parse_length(condition):
+    """Split a length condition such as '> 15' into (ufunc, seconds)"""
+    match = _LENGTH_CONDITION.match(condition)
+    if match is None:
+        raise ValueError(f"Invalid length condition: {condition!r}")
+    return _OPERATORS[match.group(1)], float(match.group(2))
+
+
+def load_flag_rules(path=FLAG_RULES_PATH):
+    """Load flag rules and per-campaign threshold overrides from a JSON config"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    rules = []
+    for i, rule in enumerate(config["rules"]):
+        op, seconds = _parse_length(rule["length"]) if rule.get("length") else (None, None)
+        rules.append({
+            'name': rule["name"],
+            'column': f"Flag - {rule['name']}",
+            'bit': 1 << i,
+            'dispositions': list(rule["dispositions"]),
+            'op': op,
+            'seconds': seconds,
+            'measure': rule.get("measure", 'Recording Length (Seconds)'),
+            'counts_as_flagged': rule.get("counts_as_flagged", True),
+        })
+    if len(rules) > 64:
+        raise ValueError("At most 64 flag rules are supported")
+
+    names = {rule['name'] for rule in rules}
+    overrides = config.get("campaign_overrides", {})
+    for campaign, thresholds in overrides.items():
+        unknown = set(thresholds) - names
+        if unknown:
+            raise ValueError(f"Unknown rule(s) in overrides for {campaign!r}: {sorted(unknown)}")
+
+    dtype = next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.iinfo(t).bits >= len(rules))
+    return {
+        'rules': rules,
+        'campaign_overrides': {c: {n: float(s) for n, s in t.items()} for c, t in overrides.items()},
+        'dtype': dtype,
+        'flagged_bits': sum(rule['bit'] for rule in rules if rule['counts_as_flagged']),
+    }
+
+
+FLAG_RULES = load_flag_rules()
+
+# Columns held as dictionary-encoded categoricals (int codes + a vocabulary)
+CATEGORICAL_COLUMNS = ['Agent Name', 'Current campaign', 'Disposition']
+
+
+def encode_categorical(series, strip=False):
+    """Dictionary-encode a text column, optionally stripping each distinct value once"""
+    codes, uniques = pd.factorize(series)
+    values = pd.Index(uniques).astype(str)
+    if strip:
+        values = values.str.strip()
+    # Stripping can merge values, so re-factorize the (small) vocabulary and remap codes
+    remap, categories = pd.factorize(values, sort=True)
+    codes = np.where(codes >= 0, np.append(remap, -1)[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=series.index, name=series.name)
+
+
+def parse_lengths(series):
+    """pd.to_numeric(errors='coerce'), parsing each distinct text value only once"""
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return pd.to_numeric(series, errors='coerce')
+    codes, uniques = pd.factorize(series)
+    values = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    return pd.Series(np.append(values, np.nan)[codes], index=series.index, name=series.name)
+
+
+@profiler.timed('standardize')
+def standardize(df):
+    """Clean column names, dispositions and recording lengths, and encode text columns"""
+    df.columns = df.columns.str.strip()
+    df['Disposition'] = encode_categorical(df['Disposition'], strip=True)
+    df['Recording Length (Seconds)'] = parse_lengths(df['Recording Length (Seconds)'])
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = encode_categorical(df[column])
+    return df
+
+
+def category_mask(series, value):
+    """Boolean mask of rows equal to value, compared on categorical codes"""
+    code = series.cat.categories.get_indexer([value])[0]
+    if code < 0:
+        return np.zeros(len(series), dtype=bool)
+    return series.cat.codes.to_numpy() == code
+
+
+def category_isin(series, values):
+    """Boolean mask of rows whose value is one of values, compared on categorical codes"""
+    codes = series.cat.categories.get_indexer(list(values))
+    return np.isin(series.cat.codes.to_numpy(), codes[codes >= 0])
+
+
+def _codes(series):
+    """Integer codes and distinct values of a column (missing values get code -1)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories.to_numpy(dtype=object)
+    codes, uniques = pd.factorize(series)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+# Columns a rule can measure that aren't in the export: name -> function(df) returning
+# one value per row (NaN where unknown), computed only when a rule uses them
+MEASURE_COLUMNS = {}
+
+
+def measure_values(df, column):
+    """Numeric values a length condition is checked against (NaN never matches)"""
+    if column in df.columns:
+        values = df[column]
+    elif column in MEASURE_COLUMNS:
+        values = MEASURE_COLUMNS[column](df)
+    else:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+@profiler.timed('flags')
+def evaluate_flags(df, rule_set=None):
+    """Evaluate every flag rule in one pass and return a packed bitmask per row"""
+    rule_set = rule_set or FLAG_RULES
+    rules = rule_set['rules']
+    dtype = rule_set['dtype']
+
+    disposition_codes, dispositions = _codes(df['Disposition'])
+    measures = {}
+
+    # Candidate bits per distinct disposition; the extra last slot serves code -1
+    candidate_table = np.zeros(len(dispositions) + 1, dtype=dtype)
+    for rule in rules:
+        candidate_table[:-1][np.isin(dispositions, rule['dispositions'])] |= dtype(rule['bit'])
+    flags = candidate_table[disposition_codes]
+
+    overrides = rule_set['campaign_overrides']
+    if overrides and 'Current campaign' in df.columns:
+        campaign_codes, campaigns = _codes(df['Current campaign'])
+
+    # Clear length-conditioned bits for calls that don't cross their threshold
+    for rule in rules:
+        if rule['op'] is None or not (candidate_table & dtype(rule['bit'])).any():
+            continue
+        threshold = rule['seconds']
+        overridden = {c: t[rule['name']] for c, t in overrides.items() if rule['name'] in t}
+        if overridden and 'Current campaign' in df.columns:
+            table = np.full(len(campaigns) + 1, rule['seconds'])
+            for i, campaign in enumerate(campaigns):
+                table[i] = overridden.get(campaign, rule['seconds'])
+            threshold = table[campaign_codes]
+        if rule['measure'] not in measures:
+            measures[rule['measure']] = measure_values(df, rule['measure'])
+        failed = ~rule['op'](measures[rule['measure']], threshold)
+        flags[failed] &= dtype(~rule['bit'] & np.iinfo(dtype).max)
+    return flags
+
+
+def flag_mask(flags, name, rule_set=None):
+    """Boolean mask of rows where the named rule fired"""
+    rule_set = rule_set or FLAG_RULES
+    bit = next(rule['bit'] for rule in rule_set['rules'] if rule['name'] == name)
+    return (np.asarray(flags) & bit) != 0
+
+
+def flagged_mask(flags, rule_set=None):
+    """Boolean mask of rows flagged by any rule that counts towards 'Total Flagged'"""
+    rule_set = rule_set or FLAG_RULES
+    return (np.asarray(flags) & rule_set['flagged_bits']) != 0
+
+
+def flag_labels(df, rule_set=None):
+    """Replace the packed 'Flags' column with 'Check' label columns for display/export"""
+    rule_set = rule_set or FLAG_RULES
+    flags = df['Flags'].to_numpy()
+    position = df.columns.get_loc('Flags')
+    labelled = df.drop(columns='Flags')
+    for offset, rule in enumerate(rule_set['rules']):
+        labels = np.where((flags & rule['bit']) != 0, 'Check', '')
+        labelled.insert(position + offset, rule['column'], labels)
+    return labelled
+
+
+def format_durations(seconds):
+    """Format recording lengths as m:ss with vectorized integer arithmetic (missing -> 0:00)"""
+    seconds = pd.Series(seconds, dtype=float, copy=False)
+    values = np.nan_to_num(seconds.to_numpy(), nan=0.0)
+    minutes = np.floor_divide(values, 60).astype(np.int64)
+    secs = np.floor(np.mod(values, 60)).astype(np.int64)
+    # Lengths repeat a lot, so build each distinct m:ss string once and gather
+    codes, totals = pd.factorize(minutes * 60 + secs)
+    labels = np.array([f"{total // 60}:{total % 60:02d}" for total in totals.tolist()], dtype=object)
+    return pd.Series(labels[codes], index=seconds.index)
+
+
+def duration_labels(seconds):
+    """Bucket recording lengths into Very Short / Short / OK"""
+    return pd.cut(seconds, bins=[0, 30, 60, float('inf')], labels=['Very Short', 'Short', 'OK'])
+
+
+# Display-only columns, derived on demand for the rows that are shown or exported
+DERIVED_COLUMNS = {
+    'Call Duration Label': duration_labels,
+    'Recording Length (Formatted)': format_durations,
+}
+
+
+def select_rows(df, rows, columns=None):
+    """Rows of the base frame with derived display columns computed for just those rows
+
+    columns limits the result to the listed (stored or derived) columns, skipping
+    any that don't exist; by default every stored and derived column is included.
+    """
+    if columns is None:
+        columns = list(df.columns) + list(DERIVED_COLUMNS)
+    stored = [col for col in columns if col in df.columns]
+    frame = df[stored].iloc[rows] if stored != list(df.columns) else df.iloc[rows]
+    derived = {
+        column: DERIVED_COLUMNS[column](df['Recording Length (Seconds)'].iloc[rows])
+        for column in columns if column in DERIVED_COLUMNS and column not in df.columns
+    }
+    if derived:
+        frame = frame.assign(**derived)
+    return frame[[col for col in columns if col in frame.columns]]
+
+
+def prepare_dataset(df):
+    """Turn a freshly parsed export into the AuditDataset every view reads from
+
+    Standardizes and flags the frame in place and pre-aggregates it once. The
+    result is shared between reruns and sessions and must not be mutated.
+    """
+    df = standardize(df)
+    df['Flags'] = evaluate_flags(df)
+    return AuditDataset(df)
+
+
+def prepare_combined(frames):
+    """prepare_dataset over several exports, dropping calls repeated across them
+
+    Frames are aligned on their stripped column names and concatenated in
+    order. A call is dropped when its call_keys() hash already appeared in an
+    earlier export; repeats within one export are all kept, as prepare_dataset
+    keeps them, so adding a second file never changes the first one's counts.
+    """
+    for df in frames:
+        df.columns = df.columns.str.strip()
+    sources = np.repeat(np.arange(len(frames)), [len(df) for df in frames])
+    df = standardize(pd.concat(frames, ignore_index=True))
+    # Sources are in ascending order, so a key's first row is in the earliest export that has it
+    _, first, inverse = np.unique(call_keys(df), return_index=True, return_inverse=True)
+    unique = sources == sources[first][inverse]
+    if not unique.all():
+        df = df[unique].reset_index(drop=True)
+    df['Flags'] = evaluate_flags(df)
+    return AuditDataset(df, source_rows=np.bincount(sources[unique], minlength=len(frames)))
+
+
+# Cube dimensions: categorical columns (by code) plus the packed flag bits
+CUBE_DIMENSIONS = {'agent': 'Agent Name', 'campaign': 'Current campaign', 'disposition': 'Disposition'}
+
+
+@profiler.timed('cube')
+def build_cube(df):
+    """Call counts and duration sums per agent x campaign x disposition x flags"""
+    keys = {}
+    for dimension, column in CUBE_DIMENSIONS.items():
+        codes = df[column].cat.codes.to_numpy() if column in df.columns else np.full(len(df), -1, np.int8)
+        keys[dimension] = codes.astype(np.int64) + 1  # shift so missing (-1) becomes 0
+    keys['flags'] = df['Flags'].to_numpy().astype(np.int64)
+
+    # Pack all dimensions into one int64 key and aggregate with factorize + bincount,
+    # which is much cheaper than a multi-column groupby
+    sizes = {dimension: int(values.max(initial=0)) + 1 for dimension, values in keys.items()}
+    if np.prod(list(sizes.values()), dtype=float) >= 2 ** 62:
+        raise ValueError("Too many distinct agents/campaigns/dispositions/flags for the cube")
+    packed = np.zeros(len(df), dtype=np.int64)
+    for dimension, values in keys.items():
+        packed = packed * sizes[dimension] + values
+    groups, uniques = pd.factorize(packed, sort=True)
+
+    # Unpack each group's key back into its dimension codes
+    cube = {}
+    for dimension in reversed(list(keys)):
+        uniques, cube[dimension] = np.divmod(uniques, sizes[dimension])
+    for dimension in CUBE_DIMENSIONS:
+        cube[dimension] = (cube[dimension] - 1).astype(np.int32)
+    cube['flags'] = cube['flags'].astype(df['Flags'].dtype)
+    cube = pd.DataFrame({dimension: cube[dimension] for dimension in keys})
+
+    seconds = df['Recording Length (Seconds)'].to_numpy(dtype=float, na_value=np.nan)
+    cube['calls'] = np.bincount(groups, minlength=len(cube))
+    cube['seconds'] = np.bincount(groups, weights=np.nan_to_num(seconds), minlength=len(cube))
+    return cube
+
+
+class RowIndex:
+    """Row positions grouped by categorical code, for drill-down without a scan"""
+
+    def __init__(self, series):
+        codes = series.cat.codes.to_numpy()
+        self.categories = series.cat.categories
+        self.order = np.argsort(codes, kind='stable')
+        # offsets[code + 1]:offsets[code + 2] spans the rows of each code (-1 = missing)
+        self.offsets = np.searchsorted(codes[self.order], np.arange(-1, len(self.categories) + 1))
+
+    def code(self, value):
+        return self.categories.get_indexer([value])[0]
+
+    def rows(self, code):
+        if code < 0:
+            return np.empty(0, dtype=self.order.dtype)
+        return self.order[self.offsets[code + 1]:self.offsets[code + 2]]
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes + self.offsets.nbytes
+
+
+# Columns the flagged calls can be sorted by, by label
+SORT_COLUMNS = {'Agent': 'Agent Name', 'Disposition': 'Disposition', 'Duration': 'Recording Length (Seconds)'}
+
+# Flagged calls handed out per frame for exports, and read per chunk when scanning a spill file
+FLAGGED_CHUNK_ROWS = 100_000
+FLAGGED_SCAN_ROWS = 256 * 1024
+
+
+def sort_keys(values, descending=False):
+    """Float keys that order a column ascending (or descending), missing values last, when sorted ascending"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Categories are sorted, so codes order like the values
+        keys = values.cat.codes.to_numpy().astype(float)
+        keys[keys < 0] = np.nan
+    else:
+        keys = values.to_numpy(dtype=float, na_value=np.nan)
+    return np.where(np.isnan(keys), np.inf, -keys if descending else keys)
+
+
+class AuditDataset:
+    """A preprocessed call log with its aggregate cube and per-agent/campaign row indexes
+
+    Summary cards, pies and totals are answered from the cube, so changing the
+    agent or campaign filter costs a lookup over a few aggregate rows instead of
+    passes over every call.
+    """
+
+    def __init__(self, df, rule_set=None, cube=None, source_rows=None):
+        self.df = df
+        self.rule_set = rule_set or FLAG_RULES
+        # Rows each export contributed, in order, when the frame combines several
+        self.source_rows = source_rows
+        self.cube = build_cube(df) if cube is None else cube
+        self.indexes = {
+            dimension: RowIndex(df[column])
+            for dimension, column in CUBE_DIMENSIONS.items() if column in df.columns
+        }
+        self._flagged_rows = np.flatnonzero(flagged_mask(df['Flags'], self.rule_set))
+        self._flagged_orders = {}
+        self._flagged_phones = None
+        self._phone_search = None
+        self._agent_summary = None
+        self._campaign_summary = None
+        self._fixed_nbytes = None
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def columns(self):
+        return self.df.columns
+
+    @property
+    def nbytes(self):
+        """Resident size in bytes, including the sort orders, phone search and summaries built so far"""
+        if self._fixed_nbytes is None:
+            # The frame, cube and indexes never change, so they are only measured once
+            self._fixed_nbytes = (int(self.df.memory_usage(deep=True).sum()) + int(self.cube.memory_usage().sum())
+                                  + sum(index.nbytes for index in self.indexes.values()) + self._flagged_rows.nbytes)
+        caches = [cache for cache in (self._flagged_phones, self._agent_summary, self._campaign_summary)
+                  if cache is not None]
+        return (self._fixed_nbytes + sum(order.nbytes for order in self._flagged_orders.values())
+                + sum(int(np.sum(cache.memory_usage(deep=True))) for cache in caches)
+                + (self._phone_search[1].nbytes if self._phone_search is not None else 0))
+
+    def _filters(self, agent, campaign):
+        """(dimension, code) pairs for the active filters; unknown columns are ignored"""
+        filters = []
+        for dimension, value in (('agent', agent), ('campaign', campaign)):
+            if value is not None and dimension in self.indexes:
+                filters.append((dimension, self.indexes[dimension].code(value)))
+        return filters
+
+    def cube_slice(self, agent=None, campaign=None):
+        """Aggregate rows for the given agent/campaign (None means all)"""
+        cube = self.cube
+        for dimension, code in self._filters(agent, campaign):
+            cube = cube[cube[dimension].to_numpy() == code]
+        return cube
+
+    def _narrow(self, rows, filters):
+        for dimension, code in filters:
+            rows = rows[self.df[CUBE_DIMENSIONS[dimension]].cat.codes.to_numpy()[rows] == code]
+        return rows
+
+    def rows(self, agent=None, campaign=None):
+        """Row positions of calls matching the filters, in file order"""
+        filters = self._filters(agent, campaign)
+        if not filters:
+            return np.arange(len(self.df))
+        dimension, code = filters[0]
+        return self._narrow(self.indexes[dimension].rows(code), filters[1:])
+
+    def _flagged_order(self, column, descending):
+        """Positions into the flagged rows ordering them by a column (missing last), sorted once per column and direction"""
+        order = self._flagged_orders.get((column, descending))
+        if order is None:
+            order = np.argsort(sort_keys(self.df[column].iloc[self._flagged_rows], descending), kind='stable')
+            self._flagged_orders[(column, descending)] = order
+        return order
+
+    def _phone_matches(self, text):
+        """Boolean mask over the flagged calls whose phone number contains text"""
+        search = self._phone_search
+        if search is not None and search[0] == text:
+            return search[1]
+        if 'Phone Number' not in self.df.columns:
+            return np.zeros(len(self._flagged_rows), dtype=bool)
+        if self._flagged_phones is None:
+            self._flagged_phones = self.df['Phone Number'].iloc[self._flagged_rows].astype('string')
+        matches = self._flagged_phones.str.contains(text, regex=False, na=False).to_numpy(dtype=bool)
+        # Paging through the results asks for the same search again
+        self._phone_search = (text, matches)
+        return matches
+
+    def flagged_rows(self, agent=None, campaign=None, sort_by=None, descending=False, phone=None):
+        """Row positions of flagged calls matching the filters
+
+        In file order unless sort_by names a column to order them by; phone
+        keeps only calls whose phone number contains that text.
+        """
+        if sort_by is None and not phone:
+            return self._narrow(self._flagged_rows, self._filters(agent, campaign))
+        order = np.arange(len(self._flagged_rows)) if sort_by is None else self._flagged_order(sort_by, descending)
+        if phone:
+            order = order[self._phone_matches(phone)[order]]
+        return self._narrow(self._flagged_rows[order], self._filters(agent, campaign))
+
+    def flagged_total(self, agent=None, campaign=None, phone=None):
+        """Number of flagged calls matching the filters that can be listed and exported"""
+        return len(self.flagged_rows(agent, campaign, phone=phone))
+
+    def flagged_page(self, agent=None, campaign=None, sort_by=None, descending=False, phone=None, start=0,
+                     size=100, columns=None):
+        """Flagged calls start to start + size, filtered and ordered as by flagged_rows(), via select_rows()"""
+        rows = self.flagged_rows(agent, campaign, sort_by, descending, phone)
+        return select_rows(self.df, rows[start:start + size], columns)
+
+    def flagged_frames(self, agent=None, campaign=None, columns=None, chunk_rows=FLAGGED_CHUNK_ROWS):
+        """The flagged calls matching the filters in file order, via select_rows(), chunk_rows at a time
+
+        Always yields at least one (possibly empty) frame.
+        """
+        rows = self.flagged_rows(agent, campaign)
+        for start in range(0, max(len(rows), 1), chunk_rows):
+            yield select_rows(self.df, rows[start:start + chunk_rows], columns)
+
+    def flag_counts(self, agent=None, campaign=None):
+        """Number of calls each rule fired on, plus 'Total Flagged'"""
+        cube = self.cube_slice(agent, campaign)
+        flags = cube['flags'].to_numpy()
+        calls = cube['calls'].to_numpy()
+        counts = {rule['name']: int(calls[(flags & rule['bit']) != 0].sum()) for rule in self.rule_set['rules']}
+        counts['Total Flagged'] = int(calls[flagged_mask(flags, self.rule_set)].sum())
+        return counts
+
+    def disposition_counts(self, dispositions, agent=None, campaign=None):
+        """Calls per disposition among the given ones, largest first, zero counts dropped"""
+        cube = self.cube_slice(agent, campaign)
+        categories = self.df['Disposition'].cat.categories
+        codes = cube['disposition'].to_numpy()
+        valid = codes >= 0
+        totals = np.bincount(codes[valid], weights=cube['calls'].to_numpy()[valid], minlength=len(categories))
+        counts = pd.Series(totals.astype(np.int64), index=categories)
+        counts = counts[counts.index.isin(dispositions) & (counts > 0)]
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def agent_summary(self):
+        """Per-agent issue overview for all calls, computed once from the cube"""
+        if self._agent_summary is None:
+            self._agent_summary = agent_summary(self.cube, self.df, self.rule_set)
+        return self._agent_summary
+
+    def campaign_summary(self):
+        """Per-campaign dispositions and reachability verdict, computed once from the cube"""
+        if self._campaign_summary is None:
+            self._campaign_summary = campaign_summary(self.cube, self.df, self.rule_set)
+        return self._campaign_summary
+
+
+class StreamedDataset(AuditDataset):
+    """An AuditDataset whose flagged calls stay in an on-disk spill file
+
+    Counts, summaries and pies come from the cube over every call, as for any
+    dataset, and the frame holds no rows, only the columns and categories. The
+    flagged calls table and exports scan the spill file a chunk at a time, so
+    memory does not grow with the number of flagged calls. Categorical columns
+    are spilled as codes of first appearance, which remaps turn into codes of
+    the sorted categories. The file is deleted along with the dataset.
+    """
+
+    def __init__(self, df, spill, remaps, rule_set=None, cube=None):
+        super().__init__(df, rule_set, cube=cube)
+        self.spill = spill
+        self._remaps = remaps
+        self._key_counts_cache = None
+        weakref.finalize(self, spill.remove)
+
+    def _frames(self, columns, agent=None, campaign=None, phone=None, chunk_rows=FLAGGED_SCAN_ROWS):
+        """Flagged calls matching the filters from the spill file, chunk by chunk, restricted to columns"""
+        filters = self._filters(agent, campaign)
+        if any(code < 0 for _, code in filters):
+            return
+        read = list(dict.fromkeys(list(columns) + [CUBE_DIMENSIONS[dimension] for dimension, _ in filters]
+                                  + (['Phone Number'] if phone else [])))
+        for frame in self.spill.frames(read, rows=chunk_rows):
+            for column, remap in self._remaps.items():
+                if column in frame.columns:
+                    codes = remap[frame[column].to_numpy()]
+                    frame[column] = pd.Categorical.from_codes(codes, self.df[column].cat.categories)
+            keep = np.ones(len(frame), dtype=bool)
+            for dimension, code in filters:
+                keep &= frame[CUBE_DIMENSIONS[dimension]].cat.codes.to_numpy() == code
+            if phone:
+                if 'Phone Number' not in frame.columns:
+                    return
+                keep &= frame['Phone Number'].str.contains(phone, regex=False, na=False).to_numpy(dtype=bool)
+            yield frame.loc[keep, [column for column in columns if column in frame.columns]]
+
+    def _key_counts(self, agent, campaign, sort_by, descending, phone):
+        """Distinct sort keys of the matching flagged calls, in page order, with the calls per key"""
+        query = (agent, campaign, sort_by, descending, phone)
+        if self._key_counts_cache is not None and self._key_counts_cache[0] == query:
+            return self._key_counts_cache[1]
+        if sort_by is None and not phone:
+            # File order: one key, and the cube already knows how many calls have it
+            total = self.flagged_total(agent, campaign)
+            return np.zeros(1 if total else 0), np.array([total] if total else [], dtype=np.int64)
+        keys, counts = np.empty(0), np.empty(0, dtype=np.int64)
+        for frame in self._frames([] if sort_by is None else [sort_by], agent, campaign, phone):
+            chunk_keys, chunk_counts = np.unique(self._sort_keys(frame, sort_by, descending), return_counts=True)
+            keys, inverse = np.unique(np.concatenate([keys, chunk_keys]), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate([counts, chunk_counts]),
+                                 minlength=len(keys)).astype(np.int64)
+        # Paging through the results asks for the same counts again
+        self._key_counts_cache = (query, (keys, counts))
+        return keys, counts
+
+    @staticmethod
+    def _sort_keys(frame, sort_by, descending=False):
+        if sort_by is None or sort_by not in frame.columns:
+            return np.zeros(len(frame))
+        return sort_keys(frame[sort_by], descending)
+
+    def flagged_total(self, agent=None, campaign=None, phone=None):
+        if not phone:
+            return self.flag_counts(agent, campaign)['Total Flagged']
+        return int(self._key_counts(agent, campaign, None, False, phone)[1].sum())
+
+    def flagged_page(self, agent=None, campaign=None, sort_by=None, descending=False, phone=None, start=0,
+                     size=100, columns=None):
+        """One page of the flagged calls, in two scans of the spill file
+
+        The first scan counts the calls per sort key (and is cached), which
+        tells how many calls of each key come before the page; the second keeps
+        just the calls of each key that fall on it. Calls with equal keys stay
+        in file order, as with a stable sort.
+        """
+        keys, counts = self._key_counts(agent, campaign, sort_by, descending, phone)
+        before = np.cumsum(counts) - counts
+        # The calls of each key on the page are its first[i]-th up to (not including) its last[i]-th
+        first = np.clip(start - before, 0, counts)
+        last = np.clip(start + size - before, 0, counts)
+        wanted = last > first
+        keys, first, last = keys[wanted], first[wanted], last[wanted]
+
+        columns = list(self.df.columns) + list(DERIVED_COLUMNS) if columns is None else list(columns)
+        stored = [column for column in self.df.columns if column in columns]
+        if any(column in DERIVED_COLUMNS for column in columns):
+            stored.append('Recording Length (Seconds)')
+        if sort_by is not None:
+            stored.append(sort_by)
+        stored = list(dict.fromkeys(stored))
+
+        parts, ids, ranks = [], [], []
+        seen = np.zeros(len(keys), dtype=np.int64)
+        if len(keys):
+            for frame in self._frames(stored, agent, campaign, phone):
+                frame_keys = self._sort_keys(frame, sort_by, descending)
+                found = np.minimum(np.searchsorted(keys, frame_keys), len(keys) - 1)
+                rows = np.flatnonzero(keys[found] == frame_keys)
+                found = found[rows]
+                # Rank of each call among the calls with its key, counting earlier chunks
+                order = np.argsort(found, kind='stable')
+                rank = np.empty(len(rows), dtype=np.int64)
+                rank[order] = np.arange(len(rows)) - np.searchsorted(found[order], found[order])
+                rank += seen[found]
+                seen += np.bincount(found, minlength=len(keys))
+                on_page = (rank >= first[found]) & (rank < last[found])
+                parts.append(frame.iloc[rows[on_page]])
+                ids.append(found[on_page])
+                ranks.append(rank[on_page])
+                if (seen >= last).all():
+                    break
+        if not parts:
+            return select_rows(self.df, np.empty(0, dtype=np.int64), columns)
+        page = pd.concat(parts)
+        page = page.iloc[np.lexsort((np.concatenate(ranks), np.concatenate(ids)))]
+        return select_rows(page, np.arange(len(page)), columns)
+
+    def flagged_frames(self, agent=None, campaign=None, columns=None, chunk_rows=FLAGGED_CHUNK_ROWS):
+        stored = list(self.df.columns)
+        empty = True
+        for frame in self._frames(stored, agent, campaign, chunk_rows=chunk_rows):
+            if len(frame):
+                empty = False
+                yield select_rows(frame, np.arange(len(frame)), columns)
+        if empty:
+            yield select_rows(self.df, np.empty(0, dtype=np.int64), columns)
+
+
+def named_cube(df):
+    """build_cube with dimension codes replaced by their values (None when missing)"""
+    cube = build_cube(df)
+    for dimension, column in CUBE_DIMENSIONS.items():
+        categories = df[column].cat.categories if column in df.columns else pd.Index([])
+        cube[dimension] = np.append(categories.to_numpy(dtype=object), None)[cube[dimension].to_numpy()]
+    return cube
+
+
+def _merge_cubes(*cubes):
+    """Sum named cubes over their shared agent/campaign/disposition/flags keys"""
+    cubes = [cube for cube in cubes if cube is not None]
+    keys = list(CUBE_DIMENSIONS) + ['flags']
+    merged = pd.concat(cubes, ignore_index=True)
+    return merged.groupby(keys, dropna=False, sort=False, as_index=False)[['calls', 'seconds']].sum()
+
+
+def encode_cube(totals, rule_set=None):
+    """Turn a named cube into a coded one; returns (cube, sorted categories per dimension)"""
+    rule_set = rule_set or FLAG_RULES
+    categories = {
+        dimension: pd.Index(sorted(totals[dimension].dropna().unique())).astype(str)
+        for dimension in CUBE_DIMENSIONS
+    }
+    cube = pd.DataFrame({
+        dimension: categories[dimension].get_indexer(totals[dimension]).astype(np.int32)
+        for dimension in CUBE_DIMENSIONS
+    })
+    cube['flags'] = totals['flags'].to_numpy().astype(rule_set['dtype'])
+    cube['calls'] = totals['calls'].to_numpy(dtype=np.int64)
+    cube['seconds'] = totals['seconds'].to_numpy(dtype=float)
+    cube = cube.sort_values(list(CUBE_DIMENSIONS) + ['flags'], kind='stable', ignore_index=True)
+    return cube, categories
+
+
+def _recode(series, categories):
+    """Map a categorical column onto a superset vocabulary, comparing codes only"""
+    remap = np.append(categories.get_indexer(series.cat.categories), -1)
+    codes = remap[series.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=series.index, name=series.name)
+
+
+def _spill_codes(flagged, vocabularies):
+    """flagged with its categorical columns as int32 codes into growing vocabularies (in order of first appearance)"""
+    columns = {}
+    for column, vocabulary in vocabularies.items():
+        if column in flagged.columns:
+            categories = flagged[column].cat.categories
+            vocabulary = vocabulary.append(categories[~categories.isin(vocabulary)])
+            vocabularies[column] = vocabulary
+            remap = np.append(vocabulary.get_indexer(categories), -1).astype(np.int32)
+            columns[column] = remap[flagged[column].cat.codes.to_numpy()]
+    return flagged.assign(**columns)
+
+
+def stream_dataset(chunks, rule_set=None, spill_dir=None):
+    """Build an AuditDataset from an export read chunk by chunk
+
+    Each chunk is standardized and flagged, folded into a running aggregate cube
+    and then dropped; only its flagged calls are appended to a spill file. The
+    result is a StreamedDataset: counts, the agent summary and the campaign pies
+    come from the cube over every call, and the flagged calls stay on disk.
+    """
+    rule_set = rule_set or FLAG_RULES
+    totals = None
+    offset = 0
+    empty = None
+    vocabularies = {column: pd.Index([], dtype=object) for column in CUBE_DIMENSIONS.values()}
+    spill = SpillFile(spill_dir) if spill_dir else SpillFile()
+    try:
+        for chunk in chunks:
+            # Label rows with their position in the file, as a one-shot read would
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            chunk = standardize(chunk)
+            chunk['Flags'] = evaluate_flags(chunk, rule_set)
+            totals = _merge_cubes(totals, named_cube(chunk))
+
+            flagged = chunk.iloc[np.flatnonzero(flagged_mask(chunk['Flags'], rule_set))]
+            if empty is None:
+                empty = flagged.iloc[:0]
+            spill.append(_spill_codes(flagged, vocabularies))
+        if totals is None:
+            raise ValueError("No rows to read")
+
+        # Codes of the whole file's sorted vocabulary, for the cube, the frame and the spilled calls
+        cube, categories = encode_cube(totals, rule_set)
+        remaps = {}
+        for dimension, column in CUBE_DIMENSIONS.items():
+            if column in empty.columns:
+                empty[column] = _recode(empty[column], categories[dimension])
+                remaps[column] = np.append(categories[dimension].get_indexer(vocabularies[column]), -1)
+    except BaseException:
+        spill.remove()
+        raise
+
+    return StreamedDataset(empty, spill, remaps, rule_set, cube=cube)
+
+
+stream_dataset.chunked = True
+
+
+def cube_dataset(totals, rule_set=None):
+    """AuditDataset over a named cube alone: every count and summary, but no call rows"""
+    rule_set = rule_set or FLAG_RULES
+    cube, categories = encode_cube(totals, rule_set)
+    df = pd.DataFrame({
+        column: pd.Categorical([], categories=categories[dimension])
+        for dimension, column in CUBE_DIMENSIONS.items()
+    })
+    df['Recording Length (Seconds)'] = np.empty(0)
+    df['Phone Number'] = pd.array([], dtype='string')
+    df['Flags'] = np.empty(0, dtype=rule_set['dtype'])
+    return AuditDataset(df, rule_set, cube=cube)
+
+
+# Columns identifying a call when the export has no call ID
+CALL_KEY_COLUMNS = ['Phone Number', 'Agent Name', 'Recording Length (Seconds)']
+
+
+def call_keys(df):
+    """64-bit identity of each call: its 'Call ID' if present, else phone + agent + length"""
+    columns = [col for col in CALL_KEY_COLUMNS if col in df.columns]
+    keys = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    if 'Call ID' in df.columns:
+        ids = df['Call ID'].astype('string')
+        id_keys = pd.util.hash_pandas_object(ids, index=False).to_numpy()
+        keys = np.where(ids.notna().to_numpy(), id_keys, keys)
+    return keys.view(np.int64)
+
+
+def raw_call_keys(df):
+    """call_keys() of unprocessed text columns (such as a recordings listing), matching standardized call logs"""
+    df = df[[col for col in CALL_KEY_COLUMNS + ['Call ID'] if col in df.columns]].astype('string')
+    if 'Agent Name' in df.columns:
+        df['Agent Name'] = encode_categorical(df['Agent Name'])
+    if 'Recording Length (Seconds)' in df.columns:
+        df['Recording Length (Seconds)'] = parse_lengths(df['Recording Length (Seconds)'])
+    return call_keys(df)
+
+
+# Flag columns shown in the Agent Summary table
+AGENT_SUMMARY_FLAGS = ['Voicemail Over 15 sec', 'Dead Call Over 15 sec', 'Unknown Under 5 sec']
+
+
+@profiler.timed('agent_summary')
+def agent_summary(cube, df, rule_set=None):
+    """Every per-agent metric in one pass over the aggregate cube
+
+    Builds agent x disposition and agent x rule count matrices with bincount,
+    then derives the flag counts, the release/tech issue verdict, rates and
+    talk time from them without touching the call rows again.
+    """
+    rule_set = rule_set or FLAG_RULES
+    agents = df['Agent Name'].cat.categories
+    dispositions = df['Disposition'].cat.categories
+    n_agents, n_dispositions = len(agents), len(dispositions)
+
+    # Calls with no agent name are left out, as groupby would drop them
+    cube = cube[cube['agent'].to_numpy() >= 0]
+    agent = cube['agent'].to_numpy().astype(np.int64)
+    disposition = cube['disposition'].to_numpy().astype(np.int64)
+    calls = cube['calls'].to_numpy()
+    flags = cube['flags'].to_numpy()
+
+    by_disposition = np.bincount(
+        agent[disposition >= 0] * n_dispositions + disposition[disposition >= 0],
+        weights=calls[disposition >= 0],
+        minlength=n_agents * n_dispositions,
+    ).reshape(n_agents, n_dispositions)
+    by_rule = np.column_stack([
+        np.bincount(agent, weights=calls * ((flags & rule['bit']) != 0), minlength=n_agents)
+        for rule in rule_set['rules']
+    ])
+    total_calls = np.bincount(agent, weights=calls, minlength=n_agents)
+    flagged_calls = np.bincount(agent, weights=calls * flagged_mask(flags, rule_set), minlength=n_agents)
+    talk_seconds = np.bincount(agent, weights=np.nan_to_num(cube['seconds'].to_numpy()), minlength=n_agents)
+
+    def disposition_total(name):
+        code = dispositions.get_indexer([name])[0]
+        return by_disposition[:, code] if code >= 0 else np.zeros(n_agents)
+
+    rule_index = {rule['name']: i for i, rule in enumerate(rule_set['rules'])}
+    summary = pd.DataFrame({'Agent Name': pd.Categorical(agents)})
+    for name in AGENT_SUMMARY_FLAGS:
+        summary[f'Flag - {name}'] = by_rule[:, rule_index[name]].astype(np.int64)
+
+    # More dead/unknown calls than decision maker/wrong number calls suggests releases or tech issues
+    good = disposition_total('Decision Maker - NYI') + disposition_total('Wrong Number')
+    bad = disposition_total('Dead Call') + disposition_total('Unknown')
+    summary['Potential Release/Tech Issue'] = np.where(good < bad, 'Yes', 'No')
+
+    summary['Total Calls'] = total_calls.astype(np.int64)
+    summary['Flagged Calls'] = flagged_calls.astype(np.int64)
+    summary['Flag Rate (%)'] = np.round(100 * flagged_calls / np.maximum(total_calls, 1), 1)
+    summary['Talk Time (Minutes)'] = np.round(talk_seconds / 60, 1)
+    return summary[total_calls > 0].reset_index(drop=True)
+
+
+# Dispositions weighed against each other for the campaign reachability verdict
+LOW_REACHABILITY = ['Dead Call', 'Unknown', 'Voicemail']
+GOOD_REACHABILITY = ['Decision Maker - NYI', 'Wrong Number']
+
+
+def reachability(counts):
+    """'Low' when dead/unknown/voicemail calls outnumber decision maker/wrong number calls
+
+    counts maps disposition to number of calls (a dict or Series); returns
+    (verdict, low engagement total, good engagement total).
+    """
+    low = sum(int(counts.get(name, 0)) for name in LOW_REACHABILITY)
+    good = sum(int(counts.get(name, 0)) for name in GOOD_REACHABILITY)
+    return ('Low' if low > good else 'Good'), low, good
+
+
+@profiler.timed('campaign_summary')
+def campaign_summary(cube, df, rule_set=None):
+    """Per-campaign call totals, reachability dispositions and verdict from the cube"""
+    rule_set = rule_set or FLAG_RULES
+    campaigns = df['Current campaign'].cat.categories if 'Current campaign' in df.columns else pd.Index([])
+    dispositions = df['Disposition'].cat.categories
+    n_campaigns = len(campaigns)
+
+    cube = cube[cube['campaign'].to_numpy() >= 0]
+    campaign = cube['campaign'].to_numpy().astype(np.int64)
+    disposition = cube['disposition'].to_numpy()
+    calls = cube['calls'].to_numpy()
+    flags = cube['flags'].to_numpy()
+
+    total_calls = np.bincount(campaign, weights=calls, minlength=n_campaigns)
+    flagged_calls = np.bincount(campaign, weights=calls * flagged_mask(flags, rule_set), minlength=n_campaigns)
+    summary = pd.DataFrame({'Current campaign': pd.Categorical(campaigns)})
+    summary['Total Calls'] = total_calls.astype(np.int64)
+    summary['Flagged Calls'] = flagged_calls.astype(np.int64)
+    summary['Flag Rate (%)'] = np.round(100 * flagged_calls / np.maximum(total_calls, 1), 1)
+
+    for name in GOOD_REACHABILITY + LOW_REACHABILITY:
+        code = dispositions.get_indexer([name])[0]
+        matches = (disposition == code) if code >= 0 else np.zeros(len(cube), dtype=bool)
+        summary[name] = np.bincount(campaign, weights=calls * matches, minlength=n_campaigns).astype(np.int64)
+    low = summary[LOW_REACHABILITY].sum(axis=1)
+    good = summary[GOOD_REACHABILITY].sum(axis=1)
+    summary['Reachability'] = np.where(low > good, 'Low', 'Good')
+    return summary[total_calls > 0].reset_index(drop=True)
+
+
+def report_tables(dataset):
+    """The agent summary and campaign summary of a dataset (flagged calls are exported with export_frames)"""
+    return {
+        'agents': dataset.agent_summary(),
+        'campaigns': dataset.campaign_summary(),
+    }
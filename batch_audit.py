@@ -0,0 +1,117 @@
+"""Audit a directory of call-log exports without the dashboard.
+
+Each CSV is processed by its own worker process. For every export this writes
+<name>_flagged, <name>_agents and <name>_campaigns tables, plus a summary.csv with
+one line per file.
+
+Usage:
+    python batch_audit.py exports/ reports/
+    python batch_audit.py exports/ reports/ --format parquet --workers 8
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import audio_analysis  # noqa: F401 (lets flag rules measure calls by their recorded audio)
+from audit_engine import prepare_dataset, report_tables, stream_dataset
+from data_loader import STREAM_THRESHOLD_BYTES, read_dataset
+from export_store import export_frames, write_frames
+
+
+def _init_worker(threads):
+    """Limit Arrow's thread pool so parallel workers don't oversubscribe the CPUs"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return
+    pa.set_cpu_count(threads)
+    pa.set_io_thread_count(threads)
+
+
+def write_table(df, path, fmt):
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def audit_file(path, output_dir, fmt='csv', stream_threshold=STREAM_THRESHOLD_BYTES):
+    """Audit one export and write its report tables; returns a summary line for it"""
+    start = time.perf_counter()
+    prepare = stream_dataset if os.path.getsize(path) > stream_threshold else prepare_dataset
+    dataset = read_dataset(path, prepare)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    # Flagged calls are written chunk by chunk; streamed exports keep them on disk throughout
+    write_frames(export_frames(dataset), os.path.join(output_dir, f"{name}_flagged.{fmt}"),
+                 'Parquet' if fmt == 'parquet' else 'CSV')
+    tables = report_tables(dataset)
+    for table, df in tables.items():
+        write_table(df, os.path.join(output_dir, f"{name}_{table}.{fmt}"), fmt)
+
+    counts = dataset.flag_counts()
+    return {
+        'File': os.path.basename(path),
+        'Total Calls': int(dataset.cube['calls'].sum()),
+        'Total Flagged': counts['Total Flagged'],
+        'Agents': len(tables['agents']),
+        'Campaigns': len(tables['campaigns']),
+        'Low Reachability Campaigns': int((tables['campaigns']['Reachability'] == 'Low').sum()),
+        'Seconds': round(time.perf_counter() - start, 2),
+        'Error': '',
+    }
+
+
+def audit_directory(input_dir, output_dir, fmt='csv', workers=None, pattern='*.csv'):
+    """Audit every matching export in input_dir across a process pool, one file per worker"""
+    paths = sorted(glob.glob(os.path.join(input_dir, pattern)))
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(paths), 1))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = {pool.submit(audit_file, path, output_dir, fmt): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'File': os.path.basename(path), 'Error': str(e)}
+                print(f"Error auditing {path}: {str(e)}", file=sys.stderr)
+            else:
+                print(f"{result['File']}: {result['Total Calls']} calls, "
+                      f"{result['Total Flagged']} flagged ({result['Seconds']}s)")
+            results.append(result)
+
+    summary = pd.DataFrame(results, columns=['File', 'Total Calls', 'Total Flagged', 'Agents', 'Campaigns',
+                                             'Low Reachability Campaigns', 'Seconds', 'Error'])
+    summary = summary.astype({column: 'Int64' for column in ['Total Calls', 'Total Flagged', 'Agents', 'Campaigns',
+                                                              'Low Reachability Campaigns']})
+    summary = summary.sort_values('File', ignore_index=True)
+    summary.to_csv(os.path.join(output_dir, 'summary.csv'), index=False)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input_dir', help='directory of call-log CSV exports')
+    parser.add_argument('output_dir', help='directory to write the report tables to')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--pattern', default='*.csv', help='glob of files to audit (default: *.csv)')
+    args = parser.parse_args()
+
+    summary = audit_directory(args.input_dir, args.output_dir, args.format, args.workers, args.pattern)
+    failed = summary['Error'].fillna('').astype(bool).sum()
+    print(f"Audited {len(summary) - failed} of {len(summary)} files into {args.output_dir}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""Benchmarks for the call audit pipeline.
+
+The suite times every stage of the pipeline (load, standardize, flag, cube,
+agent summary, filter change, export) on generated exports and compares each
+timing with benchmark_baselines.json, exiting non-zero when a stage got slower
+than the regression threshold allows.
+
+Usage:
+    python benchmark.py suite --rows 10000 100000 1000000
+    python benchmark.py suite --rows 10000000 --data-dir /tmp/calls --save-baseline
+    python benchmark.py load --rows 1000000 2000000
+    python benchmark.py memory --rows 1000000
+    python benchmark.py agent-summary --rows 5000000 --agents 2000
+    python benchmark.py prepare --rows 1000000
+    python benchmark.py stream --rows 1000000 5000000
+"""
+import argparse
+import gc
+import io
+import json
+import operator
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from audit_engine import (AuditDataset, agent_summary, build_cube, evaluate_flags, format_durations,
+                          prepare_dataset, select_rows, standardize, stream_dataset)
+from call_log_generator import make_call_log, write_call_log
+from data_loader import load_dataset, read_dataset, safe_read_csv
+from export_store import export_frames, write_frames
+
+# Suite baselines, and how much slower than its baseline a stage may get (ratio, and
+# seconds, so sub-millisecond stages don't fail on noise)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baselines.json')
+REGRESSION_THRESHOLD = 1.25
+REGRESSION_MIN_SECONDS = 0.01
+
+TABLE_COLUMNS = ['Agent Name', 'Disposition', 'Recording Length (Formatted)', 'Phone Number']
+
+
+def legacy_read_csv(uploaded_file):
+    """The original loader: a full parse per candidate encoding"""
+    for encoding in ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']:
+        try:
+            uploaded_file.seek(0)
+            return pd.read_csv(uploaded_file, encoding=encoding)
+        except Exception:
+            continue
+    uploaded_file.seek(0)
+    return pd.read_csv(uploaded_file)
+
+
+LEGACY_RULES = [
+    ('Voicemail Over 15 sec', 'Voicemail', operator.gt, 15),
+    ('Dead Call Over 15 sec', 'Dead Call', operator.gt, 15),
+    ('Decision Maker - NYI Under 10 sec', 'Decision Maker - NYI', operator.lt, 10),
+    ('Wrong Number Under 10 sec', 'Wrong Number', operator.lt, 10),
+    ('Unknown Under 5 sec', 'Unknown', operator.lt, 5),
+]
+
+
+def legacy_preprocess(frame):
+    """The original per-rerun standardization and 'Check' string flag columns"""
+    def format_duration(seconds):
+        if pd.isna(seconds):
+            return "0:00"
+        return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+    frame.columns = frame.columns.str.strip()
+    frame['Disposition'] = frame['Disposition'].str.strip()
+    frame['Recording Length (Seconds)'] = pd.to_numeric(frame['Recording Length (Seconds)'], errors='coerce')
+    for name, disposition, op, seconds in LEGACY_RULES:
+        frame[f'Flag - {name}'] = ((frame['Disposition'] == disposition)
+                                   & op(frame['Recording Length (Seconds)'], seconds)).map({True: 'Check', False: ''})
+    frame['Flag - Potential Release/Tech Issue'] = frame['Disposition'].isin(['Dead Call', 'Unknown']).map({True: 'Check', False: ''})
+    frame['Call Duration Label'] = pd.cut(frame['Recording Length (Seconds)'], bins=[0, 30, 60, float('inf')],
+                                          labels=['Very Short', 'Short', 'OK'])
+    frame['Recording Length (Formatted)'] = frame['Recording Length (Seconds)'].apply(format_duration)
+    return frame
+
+
+def legacy_rerun(cached_df, agent):
+    """The original main block: several full copies and 'Check' string flag columns"""
+    df = cached_df.copy()
+    original_df = cached_df.copy()
+    original_df = df.copy()
+    legacy_preprocess(df)
+    legacy_preprocess(original_df)
+    filtered_df = df.copy()
+    filtered_df = filtered_df[filtered_df['Agent Name'] == agent]
+    flagged = filtered_df[filtered_df[[f'Flag - {rule[0]}' for rule in LEGACY_RULES]].eq('Check').any(axis=1)]
+    return flagged[['Agent Name', 'Disposition', 'Recording Length (Formatted)', 'Phone Number']]
+
+
+def legacy_agent_summary(original_df):
+    """The original Agent Summary: groupby lambdas plus a row-wise apply"""
+    agent_summary = original_df.groupby('Agent Name').agg({
+        'Flag - Voicemail Over 15 sec': lambda x: (x == 'Check').sum(),
+        'Flag - Dead Call Over 15 sec': lambda x: (x == 'Check').sum(),
+        'Flag - Unknown Under 5 sec': lambda x: (x == 'Check').sum(),
+    }).reset_index()
+    counts = {
+        disposition: original_df.groupby('Agent Name')['Disposition'].apply(lambda x: (x == disposition).sum())
+        for disposition in ['Decision Maker - NYI', 'Wrong Number', 'Dead Call', 'Unknown']
+    }
+    agent_summary['Potential Release/Tech Issue'] = agent_summary.apply(
+        lambda row: 'Yes' if (counts['Decision Maker - NYI'].get(row['Agent Name'], 0) + counts['Wrong Number'].get(row['Agent Name'], 0))
+        < (counts['Dead Call'].get(row['Agent Name'], 0) + counts['Unknown'].get(row['Agent Name'], 0)) else 'No', axis=1
+    )
+    return agent_summary
+
+
+def rerun(dataset, agent):
+    """The current main block: cube lookups and row-position views over the shared dataset"""
+    dataset.flag_counts()
+    dataset.disposition_counts(['Decision Maker - NYI', 'Dead Call', 'Wrong Number', 'Unknown'], agent)
+    flagged_rows = dataset.flagged_rows(agent)
+    return select_rows(dataset.df, flagged_rows, TABLE_COLUMNS)
+
+
+def filter_change(dataset, agent, page_rows=100):
+    """What the dashboard computes when the agent filter changes: cube lookups and one table page"""
+    dataset.flag_counts(agent)
+    dataset.disposition_counts(['Decision Maker - NYI', 'Dead Call', 'Wrong Number', 'Unknown'], agent)
+    dataset.disposition_counts(['Decision Maker - NYI', 'Dead Call', 'Wrong Number', 'Unknown', 'Voicemail'], agent)
+    flagged_rows = dataset.flagged_rows(agent)
+    return select_rows(dataset.df, flagged_rows[:page_rows], TABLE_COLUMNS)
+
+
+def _rss_mb(field):
+    """Current (VmRSS) or peak (VmHWM) resident set size in MB, from /proc"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    raise OSError(f'{field} not available')
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS counter for this process (Linux only)"""
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def _measure_rerun(mode, rows):
+    """Child process: load a synthetic log, then report peak RSS of one rerun"""
+    df = make_call_log(rows)
+    # The busiest agent, so the rerun filters and renders the most calls
+    agent = df['Agent Name'].value_counts().index[0]
+    data = df.to_csv(index=False).encode('utf-8')
+    del df
+    if mode == 'legacy':
+        cached = legacy_read_csv(io.BytesIO(data))
+        run = lambda: legacy_rerun(cached, agent)  # noqa: E731
+    else:
+        cached = load_dataset(io.BytesIO(data), prepare=prepare_dataset)
+        run = lambda: rerun(cached, agent)  # noqa: E731
+    del data
+    gc.collect()
+    steady = _rss_mb('VmRSS')
+    _reset_peak_rss()
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print(f'{steady:.1f} {_rss_mb("VmHWM"):.1f} {elapsed:.3f}')
+
+
+def _measure_ingest(mode, path):
+    """Child process: report peak RSS and time of reading and preparing one file"""
+    gc.collect()
+    before = _rss_mb('VmRSS')
+    _reset_peak_rss()
+    start = time.perf_counter()
+    dataset = read_dataset(path, stream_dataset if mode == 'stream' else prepare_dataset)
+    elapsed = time.perf_counter() - start
+    print(f'{before:.1f} {_rss_mb("VmHWM"):.1f} {elapsed:.3f} {len(dataset.df)}')
+
+
+def bench_stream(rows_list):
+    print(f"{'rows':>10} {'file (MB)':>10} {'mode':<8} {'peak extra (MB)':>16} {'time (s)':>9} {'rows kept':>10}")
+    for rows in rows_list:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'calls.csv')
+            make_call_log(rows).to_csv(path, index=False)
+            size = os.path.getsize(path) / 1024 ** 2
+            for mode in ('full', 'stream'):
+                out = subprocess.run([sys.executable, __file__, '_ingest', mode, '--path', path],
+                                     capture_output=True, text=True, check=True).stdout.split()
+                before, peak, elapsed, kept = map(float, out)
+                print(f"{rows:>10} {size:>10.0f} {mode:<8} {peak - before:>16.1f} {elapsed:>9.3f} {int(kept):>10}")
+
+
+def bench_agent_summary(rows_list, agents, repeat):
+    print(f"{'rows':>10} {'agents':>7} {'legacy (s)':>11} {'cube build (s)':>15} {'from cube (s)':>14} {'speedup':>8}")
+    for rows in rows_list:
+        raw = make_call_log(rows, agents=agents)
+        legacy_df = legacy_preprocess(raw.copy())
+        legacy = timed(legacy_agent_summary, legacy_df, repeat=repeat)
+        del legacy_df
+        dataset = prepare_dataset(raw)
+        cube_build = timed(build_cube, dataset.df, repeat=repeat)
+        from_cube = timed(agent_summary, dataset.cube, dataset.df, repeat=repeat)
+        print(f"{rows:>10} {agents:>7} {legacy:>11.3f} {cube_build:>15.3f} {from_cube:>14.4f} "
+              f"{legacy / (cube_build + from_cube):>7.1f}x")
+
+
+def bench_prepare(rows_list, repeat):
+    print(f"{'rows':>10} {'legacy preprocess x2 (s)':>25} {'prepare_dataset (s)':>20} "
+          f"{'format, apply (s)':>18} {'format, vectorized (s)':>23} {'format, 1k shown (s)':>21}")
+    for rows in rows_list:
+        raw = make_call_log(rows).astype({'Recording Length (Seconds)': str})
+        # The old main block preprocessed both df and original_df on every rerun
+        legacy = timed(lambda: (legacy_preprocess(raw.copy()), legacy_preprocess(raw.copy())), repeat=repeat)
+        current = timed(lambda: prepare_dataset(raw.copy()), repeat=repeat)
+        # Generated logs have a few missing lengths, which the per-row lambda can't format
+        seconds = pd.to_numeric(raw['Recording Length (Seconds)'], errors='coerce').fillna(0)
+        apply_all = timed(lambda: seconds.apply(lambda x: f"{int(x // 60)}:{int(x % 60):02d}"), repeat=repeat)
+        vector_all = timed(format_durations, seconds, repeat=repeat)
+        shown = timed(format_durations, seconds.iloc[:1000], repeat=repeat)
+        print(f"{rows:>10} {legacy:>25.3f} {current:>20.3f} {apply_all:>18.3f} {vector_all:>23.3f} {shown:>21.4f}")
+
+
+def bench_memory(rows_list):
+    print(f"{'rows':>10} {'pipeline':<8} {'dataset RSS (MB)':>17} {'rerun peak (MB)':>16} {'rerun extra (MB)':>17} {'rerun (s)':>10}")
+    for rows in rows_list:
+        for mode in ('legacy', 'current'):
+            out = subprocess.run([sys.executable, __file__, '_rerun', mode, '--rows', str(rows)],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            steady, peak, elapsed = map(float, out)
+            print(f"{rows:>10} {mode:<8} {steady:>17.1f} {peak:>16.1f} {peak - steady:>17.1f} {elapsed:>10.3f}")
+
+
+def timed(fn, *args, repeat=3):
+    """Best wall-clock time of several runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def timed_fresh(make_input, fn, repeat=3):
+    """Best wall-clock time of fn on a fresh make_input() per run, not counting make_input()"""
+    best = float('inf')
+    for _ in range(repeat):
+        arg = make_input()
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def suite_timings(path, repeat):
+    """Best time of each pipeline stage on one export, in seconds"""
+    timings = {'load': timed(safe_read_csv, path, repeat=repeat)}
+    raw = safe_read_csv(path)
+    timings['standardize'] = timed_fresh(raw.copy, standardize, repeat=repeat)
+    df = standardize(raw)
+    timings['flag'] = timed(evaluate_flags, df, repeat=repeat)
+    df['Flags'] = evaluate_flags(df)
+    timings['cube'] = timed(build_cube, df, repeat=repeat)
+    dataset = AuditDataset(df)
+    timings['agent_summary'] = timed(agent_summary, dataset.cube, df, repeat=repeat)
+    # The busiest agent, whose flagged calls take longest to select
+    agent = df['Agent Name'].value_counts().index[0]
+    timings['filter_change'] = timed(filter_change, dataset, agent, repeat=repeat)
+    with tempfile.TemporaryDirectory() as tmp:
+        export_path = os.path.join(tmp, 'flagged.csv')
+        timings['export'] = timed(lambda: write_frames(
+            export_frames(dataset), export_path, 'CSV'
+        ), repeat=repeat)
+    return timings
+
+
+def bench_suite(rows_list, repeat, baseline_path=BASELINE_PATH, save=False, threshold=REGRESSION_THRESHOLD,
+                data_dir=None):
+    """Time every stage at each size and compare with the stored baselines; returns the exit status"""
+    baselines = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baselines = json.load(f)['results']
+
+    results = {}
+    regressions = []
+    print(f"{'rows':>10} {'stage':<14} {'time (s)':>9} {'baseline (s)':>13} {'ratio':>6}  status")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in rows_list:
+            # Generated files are deterministic, so a data directory can keep them between runs
+            path = os.path.join(data_dir or tmp, f'calls_{rows}.csv')
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_call_log(path, rows)
+            timings = suite_timings(path, repeat)
+            results[str(rows)] = {stage: round(seconds, 5) for stage, seconds in timings.items()}
+            for stage, seconds in timings.items():
+                baseline = baselines.get(str(rows), {}).get(stage)
+                if baseline is None:
+                    print(f"{rows:>10} {stage:<14} {seconds:>9.4f} {'-':>13} {'-':>6}  new")
+                    continue
+                regressed = seconds > baseline * threshold and seconds - baseline > REGRESSION_MIN_SECONDS
+                if regressed:
+                    regressions.append((rows, stage))
+                print(f"{rows:>10} {stage:<14} {seconds:>9.4f} {baseline:>13.4f} {seconds / baseline:>6.2f}  "
+                      f"{'REGRESSION' if regressed else 'ok'}")
+
+    if save:
+        with open(baseline_path, 'w') as f:
+            json.dump({
+                'machine': {'platform': platform.platform(), 'cpus': os.cpu_count(), 'python': platform.python_version(),
+                            'numpy': np.__version__, 'pandas': pd.__version__},
+                'repeat': repeat,
+                'results': {**baselines, **results},
+            }, f, indent=2)
+            f.write('\n')
+        print(f"Saved baselines to {baseline_path}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than {threshold:.2f}x their baseline: "
+              + ', '.join(f'{stage} at {rows:,} rows' for rows, stage in regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+def bench_load(rows_list, repeat):
+    print(f"{'rows':>10} {'case':<22} {'legacy (s)':>11} {'new (s)':>9} {'speedup':>8}")
+    for rows in rows_list:
+        df = make_call_log(rows)
+        clean = df.to_csv(index=False).encode('utf-8')
+        # One latin-1 byte near the end makes the legacy loop parse the file twice
+        bad_tail = clean + 'Agent José,Campaign 1,Voicemail,20,5550100,1,2025-01-06 09:00:00,x\n'.encode('latin-1')
+        for case, data in [('utf-8', clean), ('latin-1 byte at end', bad_tail)]:
+            legacy = timed(lambda: legacy_read_csv(io.BytesIO(data)), repeat=repeat)
+            new = timed(lambda: safe_read_csv(io.BytesIO(data)), repeat=repeat)
+            print(f"{rows:>10} {case:<22} {legacy:>11.3f} {new:>9.3f} {legacy / new:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('bench', choices=['suite', 'load', 'memory', 'agent-summary', 'prepare', 'stream',
+                                          '_rerun', '_ingest'])
+    parser.add_argument('mode', nargs='?', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--agents', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='suite baselines file (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the suite timings as the new baselines')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='suite fails when a stage takes more than this times its baseline')
+    parser.add_argument('--data-dir', help='keep the suite\'s generated exports here between runs')
+    args = parser.parse_args()
+
+    if args.bench == 'suite':
+        return bench_suite(args.rows, args.repeat, args.baseline, args.save_baseline, args.threshold, args.data_dir)
+    elif args.bench == 'load':
+        bench_load(args.rows, args.repeat)
+    elif args.bench == 'agent-summary':
+        bench_agent_summary(args.rows, args.agents, args.repeat)
+    elif args.bench == 'prepare':
+        bench_prepare(args.rows, args.repeat)
+    elif args.bench == 'memory':
+        bench_memory(args.rows)
+    elif args.bench == 'stream':
+        bench_stream(args.rows)
+    elif args.bench == '_rerun':
+        _measure_rerun(args.mode, args.rows[0])
+    elif args.bench == '_ingest':
+        _measure_ingest(args.mode, args.path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Synthetic ReadyMode-shaped call logs for trying the audit at production scale.
+
+Files have the five audit columns plus the extra columns a real export carries.
+Agents and campaigns are Zipf-skewed, so a few of them place most calls. The
+disposition mix and per-disposition lengths follow real exports, with a few
+missing lengths and padded dispositions. Names include accented characters so
+the encoding matters. Files are written in chunks, so 10M rows don't need 10M
+rows in memory.
+
+Usage:
+    python call_log_generator.py calls.csv --rows 1000000
+    python call_log_generator.py calls_cp1252.csv --rows 100000 --encoding cp1252
+    python call_log_generator.py calls.csv --rows 10000000 --agents 2000 --campaigns 60 --stray-byte
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Disposition mix of a typical outbound campaign
+DISPOSITIONS = ['Voicemail', 'Dead Call', 'Decision Maker - NYI', 'Wrong Number', 'Unknown',
+                'Not Interested', 'Callback', 'Do Not Call']
+DISPOSITION_WEIGHTS = [0.30, 0.15, 0.15, 0.08, 0.12, 0.12, 0.05, 0.03]
+
+# Median recording length (seconds) per disposition; lengths are log-normal around it
+DISPOSITION_SECONDS = {
+    'Voicemail': 22, 'Dead Call': 9, 'Decision Maker - NYI': 45, 'Wrong Number': 12, 'Unknown': 4,
+    'Not Interested': 30, 'Callback': 60, 'Do Not Call': 15,
+}
+
+# First names for agents, several outside ASCII (all representable in cp1252)
+AGENT_FIRST_NAMES = ['Ahmed', 'José', 'Nour', 'Zoë', 'Danial', 'Renée', 'Yehia', 'François', 'Mona', 'Søren',
+                     'Ángel', 'Sara', 'Jürgen', 'Hana', 'Omar', 'Inès']
+
+# Encodings exports are seen in
+ENCODINGS = ['utf-8', 'utf-8-sig', 'cp1252', 'utf-16']
+
+# Share of calls with no recording length, and with a trailing space after the disposition
+MISSING_LENGTH_SHARE = 0.005
+PADDED_DISPOSITION_SHARE = 0.02
+
+CHUNK_ROWS = 1_000_000
+
+
+def zipf_weights(n, skew):
+    """Selection probabilities of n items whose popularity falls off as 1 / rank ** skew"""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def agent_names(agents):
+    return np.array([f'{AGENT_FIRST_NAMES[i % len(AGENT_FIRST_NAMES)]} {i}' for i in range(agents)], dtype=object)
+
+
+def make_call_log(rows, agents=200, campaigns=20, seed=0, skew=1.1, start=None, extra_columns=True, call_ids=False):
+    """Build one synthetic call log frame
+
+    start is the timestamp of the first call; calls are spread over the
+    following day. call_ids adds the optional 'Call ID' column.
+    """
+    rng = np.random.default_rng(seed)
+    dispositions = np.array(DISPOSITIONS, dtype=object)
+    codes = rng.choice(len(DISPOSITIONS), rows, p=DISPOSITION_WEIGHTS)
+    disposition = dispositions[codes]
+    padded = rng.random(rows) < PADDED_DISPOSITION_SHARE
+    disposition[padded] = disposition[padded] + ' '
+
+    medians = np.array([DISPOSITION_SECONDS[d] for d in DISPOSITIONS], dtype=float)
+    seconds = np.rint(medians[codes] * rng.lognormal(0.0, 0.6, rows)).astype(np.int64)
+    lengths = pd.array(seconds, dtype='Int64')
+    lengths[rng.random(rows) < MISSING_LENGTH_SHARE] = pd.NA
+
+    df = pd.DataFrame({
+        'Agent Name': agent_names(agents)[rng.choice(agents, rows, p=zipf_weights(agents, skew))],
+        'Current campaign': np.array([f'Campaign {i}' for i in range(campaigns)], dtype=object)[
+            rng.choice(campaigns, rows, p=zipf_weights(campaigns, skew))],
+        'Disposition': disposition,
+        'Recording Length (Seconds)': lengths,
+        'Phone Number': rng.integers(10 ** 9, 10 ** 10, rows).astype(str),
+    })
+    if call_ids:
+        df.insert(0, 'Call ID', [f'C{seed:04d}{i:09d}' for i in range(rows)])
+    if extra_columns:
+        start = pd.Timestamp(start if start is not None else '2025-01-06 08:00')
+        offsets = np.sort(rng.integers(0, 24 * 3600, rows))
+        df['Lead ID'] = rng.integers(0, 10 ** 8, rows)
+        df['Call Date'] = (start + pd.to_timedelta(offsets, unit='s')).strftime('%Y-%m-%d %H:%M:%S')
+        df['Notes'] = np.where(rng.random(rows) < 0.1, 'Follow up', '')
+    return df
+
+
+def iter_call_log(rows, chunk_rows=CHUNK_ROWS, seed=0, **kwargs):
+    """make_call_log() in chunks of chunk_rows, one day of calls per chunk"""
+    start = pd.Timestamp('2025-01-06 08:00')
+    for i, first in enumerate(range(0, rows, chunk_rows)):
+        yield make_call_log(min(chunk_rows, rows - first), seed=seed + i, start=start + pd.Timedelta(days=i),
+                            **kwargs)
+
+
+def write_call_log(path, rows, encoding='utf-8', stray_byte=False, chunk_rows=CHUNK_ROWS, **kwargs):
+    """Write a synthetic export to path; returns its size in bytes
+
+    stray_byte ends a UTF-8 file with one cp1252-encoded row, as exports edited
+    in Excel sometimes do, so only a reader that looks at the tail notices.
+    """
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        for i, frame in enumerate(iter_call_log(rows, chunk_rows, **kwargs)):
+            frame.to_csv(f, header=i == 0, index=False)
+    if stray_byte:
+        row = {'Agent Name': 'Agent José', 'Current campaign': 'Campaign 0', 'Disposition': 'Voicemail',
+               'Recording Length (Seconds)': '20', 'Phone Number': '5550100000'}
+        with open(path, 'ab') as f:
+            f.write((','.join(row.get(column, '') for column in frame.columns) + '\n').encode('cp1252'))
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='CSV file to write')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--agents', type=int, default=200)
+    parser.add_argument('--campaigns', type=int, default=20)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of agent/campaign popularity')
+    parser.add_argument('--encoding', choices=ENCODINGS, default='utf-8')
+    parser.add_argument('--stray-byte', action='store_true', help='end the file with one cp1252-encoded row')
+    parser.add_argument('--call-ids', action='store_true', help="add the optional 'Call ID' column")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.stray_byte and not args.encoding.startswith('utf-8'):
+        parser.error('--stray-byte only applies to UTF-8 files')
+    start = time.perf_counter()
+    size = write_call_log(args.path, args.rows, encoding=args.encoding, stray_byte=args.stray_byte,
+                          agents=args.agents, campaigns=args.campaigns, skew=args.skew, seed=args.seed,
+                          call_ids=args.call_ids)
+    print(f"Wrote {args.rows:,} calls ({size / 1024 ** 2:.1f} MB, {args.encoding}) to {args.path} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
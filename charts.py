@@ -0,0 +1,53 @@
+import functools
+import os
+
+import plotly.express as px
+
+from instrumentation import profiler
+
+# Slice colours, and the order slices are drawn in (Dead Call and Unknown adjacent)
+DISPOSITION_COLORS = {
+    'Decision Maker - NYI': '#4C84FF',
+    'Unknown': '#ca1b1b',
+    'Wrong Number': '#F9C74F',
+    'Dead Call': '#FF6B6B',
+    'Voicemail': '#9B59B6',
+}
+DISPOSITION_ORDER = ['Decision Maker - NYI', 'Wrong Number', 'Dead Call', 'Unknown', 'Voicemail']
+
+# Layout applied to every chart, by theme name
+CHART_THEMES = {
+    'dark': dict(height=400, plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font=dict(color='#E0E0E0')),
+}
+
+# Distinct figures kept in memory; each is a handful of slices, so entries are small
+CHART_CACHE_ENTRIES = int(os.environ.get("AUDIT_CHART_CACHE_ENTRIES", 512))
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_ENTRIES)
+def _pie(counts, title, theme):
+    labels = [f"{disposition} ({count})" for disposition, count in counts]
+    fig = px.pie(
+        values=[count for _, count in counts],
+        names=labels,
+        title=title,
+        color_discrete_map=DISPOSITION_COLORS
+    )
+    # Force the exact order we want
+    fig.update_traces(marker_colors=[DISPOSITION_COLORS.get(disposition, '#000000') for disposition, _ in counts])
+    fig.update_layout(**CHART_THEMES[theme])
+    return fig
+
+
+@profiler.timed('pie_chart')
+def disposition_pie(counts, title, theme='dark'):
+    """Pie of calls per disposition, with the counts in the legend
+
+    Built from the aggregated counts only (a mapping of disposition to calls),
+    so no call rows reach the browser. Figures are memoized on the counts,
+    title and theme, so showing the same numbers again (e.g. going back to an
+    agent) reuses the figure instead of building it with Plotly Express again.
+    The figure is shared between sessions and must not be modified.
+    """
+    ordered = [d for d in DISPOSITION_ORDER if d in counts] + [d for d in counts.keys() if d not in DISPOSITION_ORDER]
+    return _pie(tuple((d, int(counts[d])) for d in ordered), title, theme)
@@ -0,0 +1,508 @@
+import codecs
+import csv
+import hashlib
+import os
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from instrumentation import profiler
+
+# Upper bound for parsed datasets kept in memory across reruns (bytes)
+DATASET_CACHE_MAX_BYTES = int(os.environ.get("AUDIT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+DATASET_CACHE_MAX_ENTRIES = int(os.environ.get("AUDIT_CACHE_MAX_ENTRIES", 8))
+
+
+# Columns the audit reads from an export, with the dtype each is parsed as
+AUDIT_COLUMNS = {
+    'Agent Name': 'string',
+    'Current campaign': 'string',
+    'Disposition': 'string',
+    'Recording Length (Seconds)': 'string',  # coerced with pd.to_numeric later
+    'Phone Number': 'string',
+    'Call ID': 'string',  # optional; identifies calls across overlapping exports
+}
+
+# Bytes sampled from the head and tail of a file to sniff its encoding
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+
+# Streaming mode: bytes of CSV text parsed per chunk, and where flagged rows spill
+STREAM_BLOCK_BYTES = int(os.environ.get("AUDIT_STREAM_BLOCK_BYTES", 32 * 1024 ** 2))
+STREAM_READ_BYTES = 1024 * 1024
+SPILL_READ_ROWS = 1024 * 1024
+STREAM_THRESHOLD_BYTES = int(os.environ.get("AUDIT_STREAM_THRESHOLD_BYTES", 256 * 1024 ** 2))
+SPILL_DIR = os.environ.get("AUDIT_SPILL_DIR") or None
+
+# Threads parsing several uploads at once (the Arrow parser releases the GIL)
+PARSE_WORKERS = int(os.environ.get("AUDIT_PARSE_WORKERS", min(8, os.cpu_count() or 1)))
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+
+def _read_sample(source, sample_bytes=ENCODING_SAMPLE_BYTES):
+    """Return bounded (head, tail) byte samples of a file object or path"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return _read_sample(f, sample_bytes)
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    head = source.read(sample_bytes)
+    tail = b""
+    if size > sample_bytes:
+        source.seek(max(sample_bytes, size - sample_bytes))
+        tail = source.read(sample_bytes)
+    source.seek(0)
+    return head, tail
+
+
+def _is_utf8(sample, at_start=True):
+    """Check a byte sample decodes as UTF-8, tolerating characters cut at its edges"""
+    if not at_start:
+        # Skip continuation bytes of a character that started before the sample
+        i = 0
+        while i < min(3, len(sample)) and 0x80 <= sample[i] <= 0xBF:
+            i += 1
+        sample = sample[i:]
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(head, tail=b""):
+    """Guess the encoding of a CSV export from its head and tail byte samples"""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if _is_utf8(head) and _is_utf8(tail, at_start=False):
+        return "utf-8"
+
+    # Windows exports are cp1252 unless they use bytes cp1252 leaves undefined
+    if any(b in head or b in tail for b in (b"\x81", b"\x8d", b"\x8f", b"\x90", b"\x9d")):
+        return "latin-1"
+    return "cp1252"
+
+
+def _header_columns(head, encoding):
+    """Parse the raw (unstripped) column names from the first line of a file"""
+    text = head.decode(encoding, errors="replace")
+    first_line = text.splitlines()[0] if text else ""
+    return next(csv.reader([first_line]), [])
+
+
+def _parse_csv(source, encoding, usecols, dtype):
+    """Parse a CSV once with the multithreaded Arrow reader (C engine fallback)"""
+    if pa is None:
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+        return pd.read_csv(source, encoding=encoding, usecols=usecols or None, dtype=dtype or None)
+
+    if isinstance(source, (str, os.PathLike)):
+        stream = source
+    elif hasattr(source, "getbuffer"):
+        stream = pa.BufferReader(source.getbuffer())
+    else:
+        source.seek(0)
+        stream = source
+    table = pa_csv.read_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(encoding=encoding, use_threads=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=usecols or None,
+            # Keep every audit column as text so phone numbers keep leading zeros
+            column_types={name: pa.string() for name in dtype},
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype(), pa.large_string(): pd.StringDtype()}.get)
+
+
+def _csv_options(source, columns):
+    """Sniff (encoding, usecols, dtype) for reading the audit columns of an export"""
+    head, tail = _read_sample(source)
+    encoding = detect_encoding(head, tail)
+
+    # Export headers sometimes carry stray whitespace, so match on stripped names
+    header = _header_columns(head, encoding)
+    usecols = [name for name in header if name.strip() in columns]
+    dtype = {name: columns[name.strip()] for name in usecols}
+    return encoding, usecols, dtype
+
+
+# Helper function to safely read CSV files
+@profiler.timed('read_csv')
+def safe_read_csv(uploaded_file, columns=AUDIT_COLUMNS):
+    """Read a CSV export in one pass, keeping only the columns the audit uses"""
+    encoding, usecols, dtype = _csv_options(uploaded_file, columns)
+
+    try:
+        return _parse_csv(uploaded_file, encoding, usecols, dtype)
+    except ValueError as e:
+        if not encoding.startswith("utf-8"):
+            raise Exception(f"Failed to read CSV file: {str(e)}")
+    # A bad byte outside the sampled regions: latin-1 decodes any byte sequence
+    try:
+        return _parse_csv(uploaded_file, "latin-1", usecols, dtype)
+    except Exception as e:
+        raise Exception(f"Failed to read CSV file with any encoding: {str(e)}")
+
+
+def read_csvs(sources, columns=AUDIT_COLUMNS, workers=PARSE_WORKERS):
+    """Parse several exports concurrently with safe_read_csv, returning frames in input order"""
+    def read(source):
+        try:
+            return safe_read_csv(source, columns)
+        except Exception as e:
+            raise Exception(f"{getattr(source, 'name', source)}: {str(e)}")
+
+    if len(sources) == 1:
+        return [read(sources[0])]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources)))) as pool:
+        return list(pool.map(read, sources))
+
+
+def _iter_chunks(source, encoding, usecols, dtype, block_bytes):
+    if pa is None:
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+        # Rows per chunk estimated from a typical audit row of ~100 bytes
+        yield from pd.read_csv(source, encoding=encoding, usecols=usecols or None, dtype=dtype or None,
+                               chunksize=max(1, block_bytes // 100))
+        return
+
+    if isinstance(source, (str, os.PathLike)):
+        stream = source
+    elif hasattr(source, "getbuffer"):
+        stream = pa.BufferReader(source.getbuffer())
+    else:
+        source.seek(0)
+        stream = source
+    # The streaming reader buffers many blocks ahead, so read small blocks and
+    # gather their batches into chunks of about block_bytes of parsed data
+    reader = pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(encoding=encoding, block_size=min(block_bytes, STREAM_READ_BYTES)),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=usecols or None,
+            column_types={name: pa.string() for name in dtype},
+            strings_can_be_null=True,
+        ),
+    )
+    mapper = {pa.string(): pd.StringDtype(), pa.large_string(): pd.StringDtype()}.get
+    batches, size = [], 0
+    for batch in reader:
+        batches.append(batch)
+        size += batch.nbytes
+        if size >= block_bytes:
+            yield pa.Table.from_batches(batches).to_pandas(types_mapper=mapper)
+            batches, size = [], 0
+    if batches:
+        yield pa.Table.from_batches(batches).to_pandas(types_mapper=mapper)
+
+
+@profiler.timed('read_csv_streamed')
+def read_chunked(source, consume, columns=AUDIT_COLUMNS, block_bytes=STREAM_BLOCK_BYTES):
+    """Feed an export to consume() as an iterator of frames of about block_bytes each
+
+    Only one chunk is parsed at a time, so memory is bounded by the block size
+    rather than the file size. Returns whatever consume() returns.
+    """
+    encoding, usecols, dtype = _csv_options(source, columns)
+
+    try:
+        return consume(_iter_chunks(source, encoding, usecols, dtype, block_bytes))
+    except UnicodeDecodeError as e:
+        error = e
+    except ValueError as e:
+        # Arrow reports undecodable bytes as ArrowInvalid, a ValueError
+        if pa is None or not isinstance(e, pa.ArrowInvalid):
+            raise
+        error = e
+    if not encoding.startswith("utf-8"):
+        raise Exception(f"Failed to read CSV file: {str(error)}")
+    # A bad byte outside the sampled regions: start over as latin-1
+    try:
+        return consume(_iter_chunks(source, "latin-1", usecols, dtype, block_bytes))
+    except Exception as e:
+        raise Exception(f"Failed to read CSV file with any encoding: {str(e)}")
+
+
+class SpillFile:
+    """Temporary on-disk table that frames are appended to, then scanned chunk by chunk
+
+    An uncompressed Arrow IPC file when pyarrow is available, read through a
+    memory map so a scan only touches the columns it asks for; CSV otherwise.
+    The first frame appended (even an empty one) fixes the columns and their
+    types; row labels are kept. Once appending is done the file can be scanned
+    any number of times until it is removed.
+    """
+
+    def __init__(self, directory=SPILL_DIR):
+        suffix = ".arrow" if pa is not None else ".csv"
+        fd, self.path = tempfile.mkstemp(prefix="audit-spill-", suffix=suffix, dir=directory)
+        os.close(fd)
+        self.rows = 0
+        self._dtypes = None
+        self._schema = None
+        self._writer = None
+
+    def append(self, df):
+        if self._dtypes is None:
+            self._dtypes = df.dtypes.to_dict()
+        df = df.reset_index(names="__row__")
+        if pa is None:
+            df.to_csv(self.path, mode="a", header=os.path.getsize(self.path) == 0, index=False)
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = pa.ipc.new_file(self.path, self._schema)
+            self._writer.write_table(table.cast(self._schema))
+        self.rows += len(df)
+
+    def frames(self, columns=None, rows=SPILL_READ_ROWS):
+        """Close the file for writing and yield its contents in frames of up to rows rows
+
+        columns limits the frames to those columns (in the order given). Nothing
+        is yielded if no frame was ever appended; one empty frame if all were empty.
+        """
+        if self._dtypes is None:
+            return
+        self._close()
+        columns = list(self._dtypes) if columns is None else [name for name in columns if name in self._dtypes]
+        if self.rows == 0:
+            yield pd.DataFrame({name: pd.Series(dtype=self._dtypes[name]) for name in columns})
+            return
+        if pa is None:
+            dtype = {name: str(self._dtypes[name]) for name in columns}
+            for df in pd.read_csv(self.path, usecols=["__row__"] + columns, index_col="__row__", dtype=dtype,
+                                  chunksize=rows):
+                yield df[columns].rename_axis(None)
+            return
+        mapper = {pa.string(): pd.StringDtype(), pa.large_string(): pd.StringDtype()}.get
+        reader = pa.ipc.open_file(pa.memory_map(self.path))
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(["__row__"] + columns)
+            for start in range(0, batch.num_rows, rows):
+                yield batch.slice(start, rows).to_pandas(types_mapper=mapper).set_index("__row__").rename_axis(None)
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def remove(self):
+        self._close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def combined_digest(digests):
+    """Content key for a set of files, independent of their order"""
+    h = hashlib.blake2b(digest_size=16)
+    for digest in sorted(digests):
+        h.update(digest.encode())
+    return h.hexdigest()
+
+
+def file_digest(uploaded_file):
+    """Return a content hash of an uploaded file (independent of its name)"""
+    h = hashlib.blake2b(digest_size=16)
+    if hasattr(uploaded_file, "getbuffer"):
+        h.update(uploaded_file.getbuffer())
+    else:
+        uploaded_file.seek(0)
+        for block in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+            h.update(block)
+        uploaded_file.seek(0)
+    return h.hexdigest()
+
+
+def frame_nbytes(df):
+    """Approximate resident size of a DataFrame (or an object reporting nbytes) in bytes"""
+    if hasattr(df, "nbytes"):
+        return int(df.nbytes)
+    return int(df.memory_usage(deep=True).sum())
+
+
+class DatasetHandle:
+    """A session's reference to a shared dataset; released when dropped or replaced"""
+
+    def __init__(self, store, key, prepare=None):
+        self.key = key
+        self.prepare = prepare
+        self._store = store
+        # Streamlit discards a session's state when it ends, which releases the handle
+        self._finalizer = weakref.finalize(self, store.release, key)
+
+    def get(self, source):
+        """Return the shared frame, loading it from source if it is not resident"""
+        return self._store.get(self.key, lambda: read_dataset(source, self.prepare))
+
+    def release(self):
+        self._finalizer()
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+
+class DatasetStore:
+    """Process-wide, reference-counted store of datasets keyed on content hash
+
+    Sessions hold DatasetHandles rather than frames, so memory grows with the
+    number of distinct files instead of the number of logged-in users. A dataset
+    is dropped when its last handle is released; datasets loaded without a
+    handle, and over-budget entries, are evicted least recently used first.
+    Datasets that fill caches lazily (sort orders, summaries) are re-measured
+    on every lookup, so the byte budget follows what they have grown to.
+    """
+
+    def __init__(self, max_bytes=DATASET_CACHE_MAX_BYTES, max_entries=DATASET_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (df, nbytes)
+        self._refcounts = {}  # key -> number of live handles
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self.total_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def refcount(self, key):
+        return self._refcounts.get(key, 0)
+
+    def acquire(self, key, prepare=None):
+        """Register a session's interest in a dataset and return its handle"""
+        key = dataset_key(key, prepare)
+        with self._lock:
+            self._refcounts[key] = self._refcounts.get(key, 0) + 1
+        return DatasetHandle(self, key, prepare)
+
+    def release(self, key):
+        with self._lock:
+            count = self._refcounts.get(key, 0) - 1
+            if count > 0:
+                self._refcounts[key] = count
+                return
+            self._refcounts.pop(key, None)
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def get(self, key, load):
+        """Return the dataset for key, calling load() once if it is not resident"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._remeasure()
+                return entry[0]
+            lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Concurrent sessions uploading the same export only parse it once
+        with lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                df = entry[0]
+            else:
+                df = self.put(key, load())
+        with self._lock:
+            self._load_locks.pop(key, None)
+        return df
+
+    def put(self, key, df):
+        nbytes = frame_nbytes(df)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df, nbytes)
+            self.total_bytes += nbytes
+            self._evict()
+        return df
+
+    def _remeasure(self):
+        # Only objects reporting their own nbytes grow after loading; plain frames keep their size
+        changed = False
+        for key, (df, nbytes) in self._entries.items():
+            if hasattr(df, "nbytes"):
+                size = frame_nbytes(df)
+                if size != nbytes:
+                    self._entries[key] = (df, size)
+                    self.total_bytes += size - nbytes
+                    changed = True
+        if changed:
+            self._evict()
+
+    def _evict(self):
+        # Unreferenced datasets go first; a referenced one is only dropped from the
+        # store (to be reloaded by its sessions) when that alone can't meet the budget
+        for referenced in (False, True):
+            for key in list(self._entries):
+                if not self._over_budget():
+                    return
+                if key == next(reversed(self._entries)):
+                    break  # always keep the newest entry
+                if (self._refcounts.get(key, 0) > 0) == referenced:
+                    self.total_bytes -= self._entries.pop(key)[1]
+
+    def _over_budget(self):
+        return self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries
+
+    def stats(self):
+        """(key, nbytes, refcount) for every resident dataset, least recently used first"""
+        with self._lock:
+            return [(key, nbytes, self._refcounts.get(key, 0)) for key, (_, nbytes) in self._entries.items()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+dataset_store = DatasetStore()
+
+
+def dataset_key(key, prepare=None):
+    """Store key for a content hash, distinguishing raw from prepared frames"""
+    return key if prepare is None else (key, prepare.__qualname__)
+
+
+def read_dataset(source, prepare=None):
+    """Parse a CSV export and run the optional prepare step on it
+
+    A prepare step marked chunked (prepare.chunked = True) is handed an iterator
+    of chunks instead, so the export is never held in memory as one frame.
+    A list of sources is parsed concurrently and prepare gets the list of frames.
+    """
+    if isinstance(source, (list, tuple)):
+        frames = read_csvs(source)
+        return frames if prepare is None else prepare(frames)
+    if getattr(prepare, "chunked", False):
+        return read_chunked(source, prepare)
+    df = safe_read_csv(source)
+    return df if prepare is None else prepare(df)
+
+
+def load_dataset(uploaded_file, key=None, prepare=None):
+    """Parse (and optionally prepare) a file once, sharing it through the dataset store"""
+    if key is None:
+        key = file_digest(uploaded_file)
+    return dataset_store.get(dataset_key(key, prepare), lambda: read_dataset(uploaded_file, prepare))
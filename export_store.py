@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+
+from audit_engine import flag_labels
+from instrumentation import profiler
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Download formats: file suffix and MIME type (Parquet needs pyarrow)
+EXPORT_FORMATS = {
+    'CSV': ('.csv', 'text/csv'),
+    'CSV (gzip)': ('.csv.gz', 'application/gzip'),
+}
+if pq is not None:
+    EXPORT_FORMATS['Parquet'] = ('.parquet', 'application/vnd.apache.parquet')
+
+# Rows formatted and written per chunk, and the disk budget for cached exports
+EXPORT_CHUNK_ROWS = 100_000
+EXPORT_CACHE_BYTES = int(os.environ.get("AUDIT_EXPORT_CACHE_BYTES", 1024 ** 3))
+EXPORT_DIR = os.environ.get("AUDIT_EXPORT_DIR") or None
+
+
+def export_frames(dataset, agent=None, campaign=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """A dataset's flagged calls matching the filters, with derived and 'Check' label columns, chunk by chunk"""
+    for frame in dataset.flagged_frames(agent, campaign, chunk_rows=chunk_rows):
+        yield flag_labels(frame, dataset.rule_set)
+
+
+@profiler.timed('export')
+def write_frames(frames, path, fmt):
+    """Write an iterable of frames to one CSV, gzip-CSV or Parquet file without concatenating them"""
+    if fmt == 'Parquet':
+        writer = None
+        try:
+            for frame in frames:
+                if writer is None:
+                    table = pa.Table.from_pandas(frame, preserve_index=False)
+                    writer = pq.ParquetWriter(path, table.schema)
+                else:
+                    table = pa.Table.from_pandas(frame, schema=writer.schema, preserve_index=False)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+    opener = gzip.open if fmt == 'CSV (gzip)' else open
+    with opener(path, 'wt', encoding='utf-8', newline='') as f:
+        for i, frame in enumerate(frames):
+            frame.to_csv(f, header=i == 0, index=False)
+
+
+class ExportStore:
+    """Export files on disk, written once per key and shared between reruns and sessions
+
+    A key identifies the dataset and filters behind an export, so asking for
+    the same export again serves the existing file. Files are written in
+    chunks to a temporary name and renamed into place when complete; the least
+    recently used ones are deleted once the cache outgrows max_bytes.
+    """
+
+    def __init__(self, directory=EXPORT_DIR, max_bytes=EXPORT_CACHE_BYTES):
+        self.directory = directory or tempfile.mkdtemp(prefix="audit-exports-")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def path(self, key, suffix):
+        digest = hashlib.blake2b(repr((key, suffix)).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, digest + suffix)
+
+    def get(self, key, suffix, write):
+        """Path of the export for key, calling write(path) to create it if it isn't cached
+
+        Concurrent requests for the same export wait for one writer instead of
+        each writing it.
+        """
+        path = self.path(key, suffix)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(path, threading.Lock())
+        with key_lock:
+            if os.path.exists(path):
+                os.utime(path)  # mark as recently used
+                return path
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix=".export-", dir=self.directory)
+            os.close(fd)
+            try:
+                write(temp_path)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        self._evict(keep=path)
+        return path
+
+    def open(self, key, suffix, write):
+        """The export opened for reading, for handing to st.download_button
+
+        The store never holds the contents itself, and the open handle stays
+        readable even if another session evicts the file before it is read.
+        """
+        try:
+            return open(self.get(key, suffix, write), 'rb')
+        except FileNotFoundError:
+            # Evicted by another session between writing and opening: write it again
+            return open(self.get(key, suffix, write), 'rb')
+
+    def _evict(self, keep):
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path != keep:
+                    os.remove(path)
+                    total -= size
+
+
+export_store = ExportStore()
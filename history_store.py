@@ -0,0 +1,303 @@
+import datetime
+import glob
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from audit_engine import CATEGORICAL_COLUMNS, CUBE_DIMENSIONS, AuditDataset, call_keys, cube_dataset, named_cube, standardize
+
+# Root of the on-disk history of processed call logs
+HISTORY_DIR = os.environ.get(
+    "AUDIT_HISTORY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit_history"),
+)
+
+# Columns kept per call; the campaign and upload date live in the partition path
+HISTORY_COLUMNS = ['Agent Name', 'Current campaign', 'Disposition', 'Recording Length (Seconds)',
+                   'Phone Number', 'Flags']
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pa_fs
+except ImportError:
+    pa = None
+
+
+class HistoryStore:
+    """Processed call logs kept as Arrow IPC files, partitioned by campaign and upload date
+
+    Files live under campaign=<name>/date=<YYYY-MM-DD>/ and hold the standardized
+    calls with their precomputed flag bitmask (as evaluated by the rules at
+    ingestion time). Queries prune partitions by campaign and date before any
+    file is opened, and files are memory-mapped, so repeated reads are served
+    from the page cache.
+    """
+
+    def __init__(self, root=HISTORY_DIR):
+        if pa is None:
+            raise ImportError("The history store requires pyarrow")
+        self.root = root
+        self.partitioning = ds.partitioning(
+            pa.schema([('campaign', pa.string()), ('date', pa.string())]), flavor='hive'
+        )
+        self.filesystem = pa_fs.LocalFileSystem(use_mmap=True)
+
+    def contains(self, key):
+        """Whether the export with this content hash has already been stored"""
+        return bool(glob.glob(os.path.join(glob.escape(self.root), '*', '*', f'{key}-*.arrow')))
+
+    def append(self, df, key, date=None):
+        """Store the calls of one processed export under today's (or the given) date
+
+        key (the export's content hash) names the files, so appending the same
+        export again is a no-op.
+        """
+        if self.contains(key):
+            return False
+        date = (date or datetime.date.today()).isoformat()
+        columns = [col for col in HISTORY_COLUMNS if col in df.columns]
+        frame = df[columns].rename(columns={'Current campaign': 'campaign'})
+        if 'campaign' not in frame.columns:
+            frame = frame.assign(campaign=pd.Series(pd.NA, index=frame.index, dtype='string'))
+        frame = frame.assign(date=date)
+        # Categoricals are stored dictionary-encoded; partition values as plain text
+        frame['campaign'] = frame['campaign'].astype('string')
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        ds.write_dataset(
+            table, self.root, format='ipc', partitioning=self.partitioning,
+            basename_template=f'{key}-{{i}}.arrow', existing_data_behavior='overwrite_or_ignore',
+        )
+        self._touch()
+        return True
+
+    def append_exports(self, dataset, keys, date=None):
+        """append() the calls of each export in a dataset under that export's own content hash
+
+        keys are the exports' hashes in the order they were combined. An export
+        uploaded again alongside new ones is therefore not stored twice, and
+        calls repeated across exports were already dropped when combining.
+        Returns the number of exports stored.
+        """
+        rows = dataset.source_rows if dataset.source_rows is not None else [len(dataset.df)]
+        if len(rows) != len(keys):
+            raise ValueError(f"{len(keys)} keys for {len(rows)} exports")
+        bounds = np.cumsum([0] + list(rows))
+        return sum(self.append(dataset.df.iloc[start:stop], key, date)
+                   for key, start, stop in zip(keys, bounds[:-1], bounds[1:]))
+
+    def _touch(self):
+        with open(os.path.join(self.root, '.version'), 'a'):
+            pass
+        os.utime(os.path.join(self.root, '.version'))
+
+    @property
+    def version(self):
+        """Changes whenever an export is appended, for keying cached query results"""
+        try:
+            return os.stat(os.path.join(self.root, '.version')).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _dataset(self):
+        return ds.dataset(self.root, format='ipc', partitioning=self.partitioning, filesystem=self.filesystem,
+                          exclude_invalid_files=True)
+
+    def partitions(self):
+        """(campaign, date) of every stored partition, read from directory names only"""
+        partitions = set()
+        for path in glob.glob(os.path.join(glob.escape(self.root), 'campaign=*', 'date=*')):
+            # The trailing slash marks the last segment as a directory rather than a file name
+            expression = self.partitioning.parse(os.path.relpath(path, self.root).replace(os.sep, '/') + '/')
+            values = ds.get_partition_keys(expression)
+            partitions.add((values.get('campaign'), values.get('date')))
+        return sorted(partitions, key=lambda p: (p[0] is None, p[0] or '', p[1] or ''))
+
+    def campaigns(self):
+        return sorted({campaign for campaign, _ in self.partitions() if campaign is not None})
+
+    def query(self, campaigns=None, agents=None, start=None, end=None, columns=None):
+        """Calls matching the filters as an Arrow table (None means no filter)
+
+        Campaign and date predicates prune whole partitions; the agent predicate
+        is pushed down into the scan of the remaining files.
+        """
+        if not os.path.isdir(self.root):
+            return None
+        predicate = None
+        conditions = []
+        if campaigns is not None:
+            conditions.append(ds.field('campaign').isin(list(campaigns)))
+        if start is not None:
+            conditions.append(ds.field('date') >= start.isoformat())
+        if end is not None:
+            conditions.append(ds.field('date') <= end.isoformat())
+        if agents is not None:
+            conditions.append(ds.field('Agent Name').isin(list(agents)))
+        for condition in conditions:
+            predicate = condition if predicate is None else predicate & condition
+        return self._dataset().to_table(columns=columns, filter=predicate)
+
+    def load(self, campaigns=None, agents=None, start=None, end=None):
+        """AuditDataset over the matching history, reusing the stored flag bitmasks
+
+        Raises LookupError when no stored call matches.
+        """
+        table = self.query(campaigns, agents, start, end)
+        if table is None or table.num_rows == 0:
+            raise LookupError("No saved calls match these dates and campaigns")
+        df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype(), pa.large_string(): pd.StringDtype()}.get)
+        df = df.rename(columns={'campaign': 'Current campaign'})
+        df = df[[col for col in HISTORY_COLUMNS if col in df.columns] + ['date']]
+        # Dictionaries merged across files come back unsorted; the views expect sorted ones
+        for column in CATEGORICAL_COLUMNS:
+            if column not in df.columns:
+                continue
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].cat.reorder_categories(df[column].cat.categories.sort_values())
+        return AuditDataset(standardize(df))
+
+
+history_store = HistoryStore() if pa is not None else None
+
+
+# Folds into the running totals run here, one at a time
+_fold_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="running-totals")
+
+# SQLite file holding the running aggregates and the keys of every call counted in them
+RUNNING_TOTALS_PATH = os.environ.get("AUDIT_RUNNING_TOTALS", os.path.join(HISTORY_DIR, "running_totals.sqlite"))
+
+
+def occurrence_keys(keys):
+    """call_keys() made distinct per repeat within one frame
+
+    The first occurrence of a key keeps it; the nth repeat gets a hash of
+    (key, n), so a call listed three times in an export has three keys and a
+    later export listing it again matches them instead of being a new call.
+    """
+    order = np.argsort(keys, kind='stable')
+    ordered = keys[order]
+    positions = np.arange(len(keys))
+    starts = np.maximum.accumulate(np.where(np.r_[True, ordered[1:] != ordered[:-1]], positions, 0))
+    ordinals = np.empty(len(keys), dtype=np.int64)
+    ordinals[order] = positions - starts
+    repeats = pd.util.hash_pandas_object(pd.DataFrame({'key': keys, 'n': ordinals}), index=False).to_numpy()
+    return np.where(ordinals == 0, keys, repeats.view(np.int64))
+
+
+class RunningTotals:
+    """Persisted aggregate cube that new exports are folded into as they arrive
+
+    The cube (calls and talk time per agent, campaign, disposition and flag
+    combination) gives per-agent flag and disposition counts and per-campaign
+    engagement totals. Calls already counted are recognised by call_keys() and
+    skipped, so folding in an export costs time proportional to that export
+    rather than to the history.
+    """
+
+    def __init__(self, path=RUNNING_TOTALS_PATH):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS calls (key INTEGER PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS cube (
+                agent TEXT NOT NULL, campaign TEXT NOT NULL, disposition TEXT NOT NULL, flags INTEGER NOT NULL,
+                calls INTEGER NOT NULL, seconds REAL NOT NULL,
+                PRIMARY KEY (agent, campaign, disposition, flags)
+            );
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+        return conn
+
+    def fold(self, df):
+        """Add the calls of a standardized, flagged frame not counted before
+
+        A call listed n times in the frame (redials, or dead calls with no
+        phone or length) is counted n times, as the dashboard counts it; folding
+        the same export again adds nothing. Returns (calls added, calls skipped
+        as already counted).
+        """
+        keys = occurrence_keys(call_keys(df))
+        # Keys sorted, with the position each one occurs at
+        unique, first = np.unique(keys, return_index=True)
+        conn = self._connect()
+        try:
+            # One writer at a time, so two sessions can't both count the same call
+            conn.execute("BEGIN IMMEDIATE")
+            # Keys are passed as one JSON array that SQLite unpacks itself, rather than a statement per call,
+            # and are inserted in key order
+            new_keys = np.fromiter((key for (key,) in conn.execute(
+                "SELECT value FROM json_each(?) WHERE value NOT IN (SELECT key FROM calls)",
+                (json.dumps(unique.tolist()),)
+            )), dtype=np.int64)
+            conn.execute("INSERT INTO calls SELECT value FROM json_each(?)", (json.dumps(new_keys.tolist()),))
+            new = np.sort(first[np.searchsorted(unique, new_keys)])
+
+            if len(new):
+                cube = named_cube(df.iloc[new])
+                rows = zip(*(cube[dimension].fillna('').tolist() for dimension in CUBE_DIMENSIONS),
+                           cube['flags'].astype(int).tolist(), cube['calls'].astype(int).tolist(), cube['seconds'].tolist())
+                conn.executemany("""
+                    INSERT INTO cube VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (agent, campaign, disposition, flags)
+                    DO UPDATE SET calls = calls + excluded.calls, seconds = seconds + excluded.seconds
+                """, rows)
+                conn.execute("""
+                    INSERT INTO meta VALUES ('version', 1)
+                    ON CONFLICT (name) DO UPDATE SET value = value + 1
+                """)
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return len(new), len(keys) - len(new)
+
+    def fold_async(self, df):
+        """fold() on a background thread, off the page render; returns a Future of its result
+
+        Folds run one at a time in the order they were submitted.
+        """
+        return _fold_executor.submit(self.fold, df)
+
+    @property
+    def version(self):
+        """Changes whenever new calls are folded in, for keying cached views"""
+        if not os.path.exists(self.path):
+            return 0
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    def cube(self):
+        """The running cube with named dimensions (None where a value was missing)"""
+        conn = self._connect()
+        try:
+            cube = pd.read_sql_query("SELECT * FROM cube", conn)
+        finally:
+            conn.close()
+        for dimension in CUBE_DIMENSIONS:
+            cube[dimension] = cube[dimension].replace('', None).astype(object)
+        return cube
+
+    def dataset(self):
+        """AuditDataset over the running totals (no call rows); LookupError when empty"""
+        cube = self.cube()
+        if cube.empty:
+            raise LookupError("No calls have been added to the running totals")
+        return cube_dataset(cube)
+
+
+running_totals = RunningTotals()
@@ -0,0 +1,261 @@
+"""Per-stage timings and peak memory of the audit pipeline.
+
+Pipeline functions are wrapped with profiler.timed(stage). While the profiler
+is enabled (AUDIT_PROFILE=1, or the admin panel's switch), every call records
+its wall time, the peak memory traced above what was allocated when it started
+and the process RSS when it finished. Each sample is appended as a JSON line to
+a rotating log (AUDIT_PROFILE_LOG) with the stage's running p50/p95, and kept in
+memory for the dashboard. While disabled, a wrapped call costs one attribute
+check.
+
+Usage:
+    python instrumentation.py                 # p50/p95 per stage from the log
+    python instrumentation.py --since 2025-06-01
+"""
+import argparse
+import collections
+import datetime
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# JSON-lines log of every sample, rotated at PROFILE_LOG_BYTES with PROFILE_LOG_BACKUPS old files kept
+PROFILE_LOG_PATH = os.environ.get("AUDIT_PROFILE_LOG", os.path.join(os.getcwd(), "logs", "stage_timings.jsonl"))
+PROFILE_LOG_BYTES = int(os.environ.get("AUDIT_PROFILE_LOG_BYTES", 10 * 1024 ** 2))
+PROFILE_LOG_BACKUPS = int(os.environ.get("AUDIT_PROFILE_LOG_BACKUPS", 5))
+
+# Recent samples per stage that the percentiles are computed over
+PROFILE_WINDOW = 1000
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _rss_bytes():
+    """Current resident set size of the process, or None where /proc isn't available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def percentiles(seconds):
+    """(p50, p95) of a sequence of timings"""
+    p50, p95 = np.percentile(np.asarray(seconds, dtype=float), [50, 95])
+    return float(p50), float(p95)
+
+
+class _Stage:
+    """One running stage on a thread's stack"""
+
+    __slots__ = ('name', 'start', 'base', 'peak')
+
+    def __init__(self, name, base):
+        self.name = name
+        self.start = time.perf_counter()
+        self.base = base
+        self.peak = base
+
+
+class Profiler:
+    """Stage timer that can be switched on and off while the app runs
+
+    Stages nest: a stage's peak includes the stages run inside it. Memory is
+    traced with tracemalloc, which counts Python and NumPy allocations (not
+    Arrow buffers) and is process-wide, so reruns of several sessions at once
+    share their peaks. Tracing slows allocation-heavy code down while enabled.
+    """
+
+    def __init__(self, log_path=PROFILE_LOG_PATH, window=PROFILE_WINDOW):
+        self.log_path = log_path
+        self.enabled = False
+        self._window = window
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=self._window))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._logger = None
+        self._run = 0
+
+    def enable(self, enabled=True):
+        """Switch recording on or off for the whole process"""
+        with self._lock:
+            if enabled and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            elif not enabled and tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.enabled = enabled
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, name):
+        stack = self._stack()
+        if not tracemalloc.is_tracing():
+            stack.append(_Stage(name, 0))
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        # Keep the enclosing stage's peak so far before the counter is reset for this one
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        tracemalloc.reset_peak()
+        stack.append(_Stage(name, current))
+
+    def _exit(self):
+        stack = self._stack()
+        stage = stack.pop()
+        seconds = time.perf_counter() - stage.start
+        peak = 0
+        if tracemalloc.is_tracing():
+            peak = max(stage.peak, tracemalloc.get_traced_memory()[1]) - stage.base
+        run = getattr(self._local, 'run', None)
+        if run is not None:
+            self._local.samples.append({'Stage': stage.name, 'Seconds': round(seconds, 4),
+                                        'Peak (MB)': round(peak / 1024 ** 2, 1)})
+        self.record(stage.name, seconds, peak, run=run)
+
+    def timed(self, name):
+        """Decorator recording each call of a function as stage name"""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                self._enter(name)
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self._exit()
+            return wrapper
+        return decorate
+
+    def start_run(self):
+        """Begin a 'rerun' stage on this thread; stages until finish_run() belong to it"""
+        self._local.stack = []
+        self._local.run = None
+        self._local.samples = []
+        if not self.enabled:
+            return
+        with self._lock:
+            self._run += 1
+            self._local.run = self._run
+        self._enter('rerun')
+
+    def finish_run(self):
+        """End the stage started by start_run() (no-op when none is running)"""
+        stack = self._stack()
+        if stack and stack[0].name == 'rerun':
+            del stack[1:]  # stages left open by an exception
+            self._exit()
+        # Fragment reruns that follow aren't part of this run
+        self._local.run = None
+
+    def run_samples(self):
+        """Stages finished so far in this thread's current run, in the order they ended"""
+        return list(getattr(self._local, 'samples', None) or [])
+
+    def record(self, name, seconds, peak_bytes=0, run=None):
+        """Add one sample to the window and the log"""
+        with self._lock:
+            samples = self._samples[name]
+            samples.append((seconds, peak_bytes))
+            p50, p95 = percentiles([s for s, _ in samples])
+            count = len(samples)
+        rss = _rss_bytes()
+        self._log({
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'run': run,
+            'stage': name,
+            'seconds': round(seconds, 6),
+            'peak_mb': round(peak_bytes / 1024 ** 2, 3),
+            'rss_mb': None if rss is None else round(rss / 1024 ** 2, 1),
+            'p50': round(p50, 6),
+            'p95': round(p95, 6),
+            'samples': count,
+        })
+
+    def _log(self, entry):
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+                    handler = logging.handlers.RotatingFileHandler(
+                        self.log_path, maxBytes=PROFILE_LOG_BYTES, backupCount=PROFILE_LOG_BACKUPS, encoding='utf-8'
+                    )
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    logger = logging.getLogger(f'audit.profile.{id(self)}')
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                    logger.addHandler(handler)
+                    self._logger = logger
+        self._logger.info(json.dumps(entry))
+
+    def summary(self):
+        """Calls, p50/p95 seconds and largest peak (MB) per stage over the recent samples"""
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items() if values}
+        rows = []
+        for name, values in sorted(samples.items()):
+            p50, p95 = percentiles([s for s, _ in values])
+            rows.append({'Stage': name, 'Calls': len(values), 'p50 (s)': round(p50, 4), 'p95 (s)': round(p95, 4),
+                         'Peak (MB)': round(max(p for _, p in values) / 1024 ** 2, 1)})
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+def read_log(path=PROFILE_LOG_PATH, since=None):
+    """Samples from the log and its rotated backups, oldest file first"""
+    entries = []
+    # RotatingFileHandler keeps the newest backup as .1
+    for log in [f"{path}.{n}" for n in range(PROFILE_LOG_BACKUPS, 0, -1)] + [path]:
+        if not os.path.exists(log):
+            continue
+        with open(log, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or entry['time'] >= since:
+                    entries.append(entry)
+    return entries
+
+
+profiler = Profiler()
+profiler.enable(os.environ.get("AUDIT_PROFILE", "").lower() in ("1", "true", "yes"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', nargs='?', default=PROFILE_LOG_PATH, help='timings log (default: %(default)s)')
+    parser.add_argument('--since', help='only samples from this ISO date/time on')
+    args = parser.parse_args()
+
+    stages = collections.defaultdict(list)
+    for entry in read_log(args.log, args.since):
+        stages[entry['stage']].append((entry['seconds'], entry['peak_mb']))
+    if not stages:
+        print(f"No samples in {args.log}", file=sys.stderr)
+        return 1
+    print(f"{'stage':<24} {'calls':>7} {'p50 (s)':>9} {'p95 (s)':>9} {'peak (MB)':>10}")
+    for name, values in sorted(stages.items()):
+        p50, p95 = percentiles([s for s, _ in values])
+        print(f"{name:<24} {len(values):>7} {p50:>9.4f} {p95:>9.4f} {max(p for _, p in values):>10.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
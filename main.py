@@ -1,53 +1,51 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.keys import Keys
-import time
-import os
-
-# === CONFIG ===
-READYMODE_URL = "https://resva.readymode.com/login_new/?then=/"
-EMAIL = "Auditor1"
-PASSWORD = "RES@2024!"
-DOWNLOAD_DIR = os.path.join(os.getcwd(), "downloads")  # All calls go here
-
-# === SETUP BROWSER ===
-chrome_options = Options()
-chrome_options.add_experimental_option("prefs", {
-    "download.default_directory": DOWNLOAD_DIR,
-    "download.prompt_for_download": False,
-    "safebrowsing.enabled": True
-})
-driver = webdriver.Chrome(options=chrome_options)
-
-# === LOGIN ===
-driver.get(READYMODE_URL)
-time.sleep(3)
-
-# Fill login form (you may need to inspect and adjust field names)
-driver.find_element(By.NAME, "email").send_keys(EMAIL)
-driver.find_element(By.NAME, "password").send_keys(PASSWORD)
-driver.find_element(By.NAME, "password").send_keys(Keys.RETURN)
-print("Logging in...")
-time.sleep(10)
-
-# === NAVIGATE TO RECORDINGS ===
-print("Navigating to Call Recordings page...")
-driver.get("https://resva.readymode.com/login_new/?then=/")  # change this if needed
-time.sleep(10)
-
-# === DOWNLOAD FILES ===
-print("Starting downloads...")
-recordings = driver.find_elements(By.CSS_SELECTOR, "a[href$='.mp3']")
-
-if not os.path.exists(DOWNLOAD_DIR):
-    os.makedirs(DOWNLOAD_DIR)
-
-for i, rec in enumerate(recordings):
-    url = rec.get_attribute("href")
-    driver.execute_script("window.open(arguments[0]);", url)
-    print(f"Downloading call {i+1}/{len(recordings)}")
-    time.sleep(2)  # Give it time to download
-
-print("Done downloading all calls.")
-driver.quit()
+import os
+from recording_crawler import iter_recordings, login, make_driver
+from recording_downloader import DOWNLOAD_CONCURRENCY, download_all, session_from_driver
+from recording_manifest import recording_manifest as manifest, remove_browser_copies
+
+# === CONFIG ===
+READYMODE_URL = "https://resva.readymode.com/login_new/?then=/"
+RECORDINGS_URL = os.environ.get("AUDIT_RECORDINGS_URL", "https://resva.readymode.com/login_new/?then=/")  # change this if needed
+EMAIL = "Auditor1"
+PASSWORD = "RES@2024!"
+DOWNLOAD_DIR = os.path.join(os.getcwd(), "downloads")  # All calls go here
+HEADLESS = os.environ.get("AUDIT_HEADLESS", "1") != "0"
+
+# === MANIFEST ===
+# Recordings downloaded by earlier runs are listed in the manifest and not fetched again
+if os.path.isdir(DOWNLOAD_DIR):
+    removed = remove_browser_copies(DOWNLOAD_DIR)
+    if removed:
+        print(f"Removed {removed} duplicate browser copies from {DOWNLOAD_DIR}")
+
+# === SETUP BROWSER ===
+driver = make_driver(DOWNLOAD_DIR, headless=HEADLESS)
+
+def report(result):
+    manifest.record(result)
+    if result['status'] == 'failed':
+        print(f"Failed {result['url']}: {result['error']}")
+    else:
+        print(f"{result['status'].capitalize()} {os.path.basename(result['path'])} ({result['bytes']:,} bytes)")
+
+try:
+    # === LOGIN ===
+    # Waits for the form and for the browser to leave it instead of sleeping
+    # (you may need to inspect and adjust field names in recording_crawler.login)
+    print("Logging in...")
+    login(driver, READYMODE_URL, EMAIL, PASSWORD)
+
+    # === CRAWL AND DOWNLOAD ===
+    # Every page of the listing is walked; each recording missing from the
+    # manifest is queued for download over HTTP (with the browser's login
+    # cookies) as soon as its row is read
+    print("Crawling Call Recordings pages and downloading new calls...")
+    session = session_from_driver(driver)
+    recordings = manifest.missing(iter_recordings(driver, RECORDINGS_URL))
+    results = download_all(session, recordings, DOWNLOAD_DIR, concurrency=DOWNLOAD_CONCURRENCY, progress=report)
+finally:
+    driver.quit()
+
+failed = sum(result['status'] == 'failed' for result in results)
+print(f"Done: {len(results) - failed} of {len(results)} new calls in {DOWNLOAD_DIR}, {failed} failed "
+      f"({len(manifest)} recordings in the manifest).")
@@ -0,0 +1,117 @@
+import os
+
+from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Seconds to wait for a page or element before giving up
+PAGE_TIMEOUT = float(os.environ.get("AUDIT_PAGE_TIMEOUT", 30))
+
+# Listing markup; override with environment variables if the portal changes
+RECORDING_LINK_SELECTOR = os.environ.get("AUDIT_RECORDING_LINK_SELECTOR", "a[href$='.mp3']")
+NEXT_PAGE_SELECTOR = os.environ.get(
+    "AUDIT_NEXT_PAGE_SELECTOR", "a[rel='next'], .pagination .next a, .pagination a.next, button.next"
+)
+
+
+def make_driver(download_dir=None, headless=True):
+    """Chrome driver, headless by default"""
+    options = Options()
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+    if download_dir:
+        options.add_experimental_option("prefs", {
+            "download.default_directory": download_dir,
+            "download.prompt_for_download": False,
+            "safebrowsing.enabled": True,
+        })
+    return webdriver.Chrome(options=options)
+
+
+def _page_loaded(driver):
+    return driver.execute_script("return document.readyState") == "complete"
+
+
+def login(driver, url, email, password, timeout=PAGE_TIMEOUT):
+    """Sign in through the login form and wait until the browser has left it"""
+    driver.get(url)
+    wait = WebDriverWait(driver, timeout)
+    email_field = wait.until(EC.element_to_be_clickable((By.NAME, "email")))
+    password_field = driver.find_element(By.NAME, "password")
+    email_field.send_keys(email)
+    password_field.send_keys(password)
+    password_field.send_keys(Keys.RETURN)
+    try:
+        # Submitting navigates away, which detaches the old form fields
+        wait.until(EC.staleness_of(password_field))
+    except TimeoutException:
+        raise TimeoutException("Login did not complete; check the credentials") from None
+    wait.until(_page_loaded)
+
+
+def _row_metadata(link, headers):
+    """Text of the table row holding a recording link, keyed by column header"""
+    try:
+        row = link.find_element(By.XPATH, "./ancestor::tr[1]")
+    except NoSuchElementException:
+        return {}
+    cells = [cell.text.strip() for cell in row.find_elements(By.XPATH, "./td|./th")]
+    names = headers if len(headers) == len(cells) else [f"Column {i + 1}" for i in range(len(cells))]
+    return {name: value for name, value in zip(names, cells) if name}
+
+
+def _next_button(driver, selector):
+    """The enabled 'next page' control, or None on the last page"""
+    for button in driver.find_elements(By.CSS_SELECTOR, selector):
+        disabled = (button.get_attribute("disabled") is not None
+                    or button.get_attribute("aria-disabled") == "true"
+                    or "disabled" in (button.get_attribute("class") or "").split())
+        if button.is_displayed() and not disabled:
+            return button
+    return None
+
+
+def iter_recordings(driver, listing_url, timeout=PAGE_TIMEOUT, link_selector=RECORDING_LINK_SELECTOR,
+                    next_selector=NEXT_PAGE_SELECTOR, max_pages=None):
+    """Walk every page of the recordings listing, yielding each recording as it is found
+
+    Yields dicts with 'url', 'page' and the text of the link's table row keyed by
+    column header, so downloads can start while later pages are still loading.
+    Each page is waited on explicitly: the document must finish loading and
+    either recording links or a next-page control must be present.
+    """
+    driver.get(listing_url)
+    wait = WebDriverWait(driver, timeout)
+    seen_pages = set()
+    page = 1
+    while True:
+        wait.until(_page_loaded)
+        try:
+            wait.until(lambda d: d.find_elements(By.CSS_SELECTOR, link_selector)
+                       or d.find_elements(By.CSS_SELECTOR, next_selector))
+        except TimeoutException:
+            return  # an empty listing
+
+        links = driver.find_elements(By.CSS_SELECTOR, link_selector)
+        urls = tuple(link.get_attribute("href") for link in links)
+        if urls in seen_pages:
+            return  # pagination wrapped around
+        seen_pages.add(urls)
+        headers = [th.text.strip() for th in driver.find_elements(By.CSS_SELECTOR, "table thead th")]
+        for link, url in zip(links, urls):
+            yield {**_row_metadata(link, headers), 'url': url, 'page': page}
+
+        button = _next_button(driver, next_selector)
+        if button is None or (max_pages is not None and page >= max_pages):
+            return
+        marker = links[0] if links else button
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", button)
+        button.click()
+        # Full page loads and client-side table refreshes both replace the old rows
+        wait.until(EC.staleness_of(marker))
+        page += 1
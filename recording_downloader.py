@@ -0,0 +1,178 @@
+import hashlib
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Concurrent downloads, bytes per read, attempts per file and per-request timeout (s)
+DOWNLOAD_CONCURRENCY = int(os.environ.get("AUDIT_DOWNLOAD_CONCURRENCY", 8))
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_RETRIES = int(os.environ.get("AUDIT_DOWNLOAD_RETRIES", 5))
+DOWNLOAD_TIMEOUT = float(os.environ.get("AUDIT_DOWNLOAD_TIMEOUT", 60))
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    pass
+
+
+def make_session(cookies=(), user_agent=None, pool_size=DOWNLOAD_CONCURRENCY):
+    """HTTP session with a connection pool sized for concurrent downloads
+
+    cookies are Selenium-style dicts (name, value, domain, path), so the session
+    can reuse a browser login.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    for cookie in cookies:
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+    if user_agent:
+        session.headers["User-Agent"] = user_agent
+    return session
+
+
+def session_from_driver(driver, pool_size=DOWNLOAD_CONCURRENCY):
+    """HTTP session authenticated with a logged-in Selenium driver's cookies"""
+    user_agent = driver.execute_script("return navigator.userAgent")
+    return make_session(driver.get_cookies(), user_agent, pool_size)
+
+
+def recording_filename(url):
+    """File name for a recording URL: the last path segment, unquoted"""
+    name = os.path.basename(unquote(urlparse(url).path))
+    if not name:
+        raise DownloadError(f"No file name in URL: {url}")
+    return name
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in DOWNLOAD_CHUNK_BYTES blocks"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _expected_size(response, offset):
+    """Total size of the file from Content-Range or Content-Length (None if unknown)"""
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    if response.headers.get("Content-Length") is not None:
+        return offset + int(response.headers["Content-Length"])
+    return None
+
+
+def _fetch(session, url, part_path, timeout):
+    """One attempt: resume part_path from its current size; returns the expected total size"""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    # Ask for the raw bytes so sizes match Content-Length and Range offsets
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416 and offset:
+            # Nothing left to send: the part file already holds the whole recording
+            expected = _expected_size(response, 0)
+            return expected if expected is not None else offset
+        if response.status_code in RETRY_STATUSES:
+            raise requests.HTTPError(f"{response.status_code} {response.reason}", response=response)
+        response.raise_for_status()
+        if response.status_code != 206:
+            offset = 0  # server ignored the Range header: start over
+        expected = _expected_size(response, offset)
+        with open(part_path, "ab" if offset else "wb") as f:
+            for block in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                f.write(block)
+    return expected
+
+
+def download_recording(session, url, dest_dir, retries=DOWNLOAD_RETRIES, timeout=DOWNLOAD_TIMEOUT, backoff=1.0):
+    """Download one recording into dest_dir, resuming and retrying as needed
+
+    Data is streamed to <name>.part and only renamed to <name> once its size
+    matches what the server announced, so a file under its final name is
+    complete and is skipped on later runs. Returns a result dict with url,
+    path, status ('downloaded', 'skipped' or 'failed'), bytes, sha256 and error;
+    a URL that names no file fails with an empty path.
+    """
+    result = {'url': url, 'path': '', 'status': 'skipped', 'bytes': 0, 'sha256': '', 'error': ''}
+    try:
+        path = os.path.join(dest_dir, recording_filename(url))
+    except DownloadError as e:
+        # A listing row without a usable link fails on its own, not the whole batch
+        result.update(status='failed', error=str(e))
+        return result
+    result['path'] = path
+    if os.path.exists(path):
+        result.update(bytes=os.path.getsize(path), sha256=file_sha256(path))
+        return result
+
+    part_path = path + ".part"
+    for attempt in range(retries):
+        try:
+            expected = _fetch(session, url, part_path, timeout)
+            size = os.path.getsize(part_path)
+            if expected is not None and size != expected:
+                if size > expected:
+                    os.remove(part_path)  # corrupt partial: start from scratch next time
+                raise DownloadError(f"Size mismatch: got {size} bytes, expected {expected}")
+            os.replace(part_path, path)
+            result.update(status='downloaded', bytes=size, sha256=file_sha256(path), error='')
+            return result
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            result['error'] = str(e)
+            if status is not None and status not in RETRY_STATUSES:
+                break  # 4xx such as 401/403/404 won't fix itself
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                DownloadError, OSError) as e:
+            result['error'] = str(e)
+        if attempt + 1 < retries:
+            # Exponential backoff with jitter so concurrent retries don't stampede
+            time.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+    result['status'] = 'failed'
+    return result
+
+
+def download_all(session, recordings, dest_dir, concurrency=DOWNLOAD_CONCURRENCY, progress=None, **kwargs):
+    """Download recordings concurrently; returns one result dict per recording, in input order
+
+    recordings is any iterable of URLs or of dicts with a 'url' key (such as
+    recording_crawler.iter_recordings()); each is queued for download as soon
+    as it is produced, and a dict's other keys are copied into its result.
+    progress, if given, is called with each result as it completes.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    seen = set()
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for recording in recordings:
+            metadata = recording if isinstance(recording, dict) else {'url': recording}
+            if metadata.get('url') in seen:
+                continue  # a link listed twice is fetched once
+            seen.add(metadata.get('url'))
+            future = pool.submit(_download_with_metadata, session, metadata, dest_dir, kwargs)
+            if progress is not None:
+                future.add_done_callback(lambda f: progress(f.result()))
+            futures.append(future)
+    return [future.result() for future in futures]
+
+
+def _download_with_metadata(session, metadata, dest_dir, kwargs):
+    try:
+        result = download_recording(session, metadata.get('url') or '', dest_dir, **kwargs)
+    except Exception as e:
+        # Anything unexpected is reported for this recording instead of ending download_all()
+        result = {'url': metadata.get('url'), 'path': '', 'status': 'failed', 'bytes': 0, 'sha256': '',
+                  'error': str(e)}
+    return {**metadata, **result}
@@ -0,0 +1,197 @@
+import datetime
+import glob
+import json
+import os
+import re
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from audit_engine import call_keys, raw_call_keys
+from recording_downloader import file_sha256, recording_filename
+
+# SQLite file recording every downloaded recording
+RECORDING_MANIFEST_PATH = os.environ.get(
+    "AUDIT_RECORDING_MANIFEST", os.path.join(os.getcwd(), "downloads", "recordings.sqlite")
+)
+
+# Stop a sync after this many recordings in a row are already downloaded (0 crawls the whole
+# listing); only safe when the listing shows the newest calls first
+SYNC_STOP_AFTER_KNOWN = int(os.environ.get("AUDIT_SYNC_STOP_AFTER_KNOWN", 0))
+
+# paths_for() looks keys up one by one up to this many calls, and reads the whole manifest beyond
+PATHS_LOOKUP_KEYS = 10_000
+
+# Recordings listing headers that name a call-log column differently
+LISTING_COLUMN_ALIASES = {
+    'Phone': 'Phone Number',
+    'Phone number': 'Phone Number',
+    'Agent': 'Agent Name',
+    'Campaign': 'Current campaign',
+    'Length': 'Recording Length (Seconds)',
+    'Duration': 'Recording Length (Seconds)',
+    'Call Id': 'Call ID',
+    'ID': 'Call ID',
+}
+
+# Keys of a download result that describe the download rather than the call
+RESULT_FIELDS = {'url', 'path', 'status', 'bytes', 'sha256', 'error', 'page'}
+
+# "name (1).mp3": the browser's copy of a file it had already downloaded
+BROWSER_COPY = re.compile(r"^(?P<stem>.+) \(\d+\)(?P<ext>\.[^.]+)$")
+
+
+def listing_row(metadata):
+    """The call-log columns of a recording's listing row (header aliases resolved)"""
+    return {LISTING_COLUMN_ALIASES.get(name, name): value
+            for name, value in metadata.items() if name not in RESULT_FIELDS}
+
+
+class RecordingManifest:
+    """Downloaded recordings keyed by URL, with their checksum and the call they belong to
+
+    Each recording is linked to its call-log row through call_keys() of its
+    listing row, so the flagged calls of an audit can be matched to local files
+    with one indexed lookup per call. A sync only downloads URLs the manifest
+    doesn't hold (or whose file has gone missing).
+    """
+
+    def __init__(self, path=RECORDING_MANIFEST_PATH):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        # Downloads are recorded from worker threads while the crawl reads
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS recordings (
+                url TEXT PRIMARY KEY,
+                recording_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                downloaded_at TEXT NOT NULL,
+                call_key INTEGER,
+                call TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS recordings_call_key ON recordings (call_key);
+            CREATE INDEX IF NOT EXISTS recordings_recording_id ON recordings (recording_id);
+        """)
+        return conn
+
+    def get(self, url):
+        """The manifest entry for a recording URL as a dict, or None"""
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM recordings WHERE url = ?", (url,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def missing(self, recordings, stop_after_known=SYNC_STOP_AFTER_KNOWN):
+        """The recordings (URLs or dicts with a 'url' key) that still need downloading
+
+        A generator, so it can sit between the crawler and download_all();
+        recordings whose file is listed and still on disk are dropped. With
+        stop_after_known, the crawl is abandoned after that many known
+        recordings in a row.
+        """
+        conn = self._connect()
+        try:
+            known_run = 0
+            for recording in recordings:
+                url = recording['url'] if isinstance(recording, dict) else recording
+                row = conn.execute("SELECT path FROM recordings WHERE url = ?", (url,)).fetchone()
+                if row is None or not os.path.exists(row[0]):
+                    known_run = 0
+                    yield recording
+                    continue
+                known_run += 1
+                if stop_after_known and known_run >= stop_after_known:
+                    return
+        finally:
+            conn.close()
+
+    def record(self, result):
+        """Add a download_all() result to the manifest; failed downloads are left out"""
+        if result['status'] == 'failed':
+            return False
+        row = listing_row(result)
+        key = raw_call_keys(pd.DataFrame([row]))[0] if set(row) & {'Call ID', 'Phone Number'} else None
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (result['url'], recording_filename(result['url']), os.path.abspath(result['path']),
+                  result['bytes'], result['sha256'],
+                  datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                  None if key is None else int(key), json.dumps(row)))
+        finally:
+            conn.close()
+        return True
+
+    def paths_for(self, df):
+        """Local recording path of each call in a standardized frame (NA where none is known)
+
+        Calls are matched on call_keys(), so the listing must show the same
+        identifying columns as the call log.
+        """
+        keys = call_keys(df)
+        paths = pd.Series(dtype='string')
+        if os.path.exists(self.path) and len(keys):
+            conn = self._connect()
+            try:
+                if len(keys) > PATHS_LOOKUP_KEYS:
+                    # Cheaper to read every linked recording than to look up this many keys
+                    query = "SELECT call_key, path FROM recordings WHERE call_key IS NOT NULL"
+                else:
+                    conn.execute("CREATE TEMP TABLE wanted (key INTEGER PRIMARY KEY)")
+                    conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((key,) for key in keys.tolist()))
+                    query = "SELECT call_key, path FROM recordings WHERE call_key IN (SELECT key FROM wanted)"
+                found = conn.execute(query).fetchall()
+            finally:
+                conn.close()
+            if found:
+                found_keys, found_paths = zip(*found)
+                paths = pd.Series(found_paths, index=pd.Index(np.array(found_keys, dtype=np.int64)), dtype='string')
+                paths = paths[~paths.index.duplicated()]
+        positions = paths.index.get_indexer(keys) if len(paths) else np.full(len(keys), -1)
+        values = np.append(paths.to_numpy(dtype=object, na_value=None), None)[positions]
+        return pd.Series(values, index=df.index, dtype='string')
+
+    @property
+    def version(self):
+        """Changes whenever a recording is added, for keying cached results that link to recordings"""
+        # Writes land in the write-ahead log first, so its time counts as well
+        return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+                     for path in (self.path, self.path + '-wal'))
+
+    def __len__(self):
+        if not os.path.exists(self.path):
+            return 0
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+        finally:
+            conn.close()
+
+
+def remove_browser_copies(dest_dir):
+    """Delete 'name (1).ext' files identical to a 'name.ext' next to them; returns how many"""
+    removed = 0
+    for path in glob.glob(os.path.join(glob.escape(dest_dir), "* (*).*")):
+        match = BROWSER_COPY.match(os.path.basename(path))
+        if not match:
+            continue
+        original = os.path.join(dest_dir, match['stem'] + match['ext'])
+        if (os.path.exists(original) and os.path.getsize(original) == os.path.getsize(path)
+                and file_sha256(original) == file_sha256(path)):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+recording_manifest = RecordingManifest()
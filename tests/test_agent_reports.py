@@ -0,0 +1,21 @@
+import zipfile
+
+from agent_reports import build_agent_reports
+from audit_engine import prepare_dataset
+from call_log_generator import make_call_log
+from recording_manifest import RecordingManifest
+
+
+def test_agent_named_index_does_not_replace_the_index(tmp_path):
+    df = make_call_log(2000, agents=3, campaigns=2, extra_columns=False)
+    df['Agent Name'] = df['Agent Name'].map({'Ahmed 0': 'index', 'José 1': 'Index', 'Nour 2': 'Nour'})
+    path = tmp_path / 'reports.zip'
+    manifest = RecordingManifest(str(tmp_path / 'recordings.sqlite'))
+    assert build_agent_reports(prepare_dataset(df), str(path), manifest=manifest) == 3
+
+    with zipfile.ZipFile(path) as bundle:
+        assert sorted(bundle.namelist()) == ['Index (2).html', 'Nour.html', 'index (3).html', 'index.html']
+        index = bundle.read('index.html').decode()
+        assert '<title>Agent Audit</title>' in index
+        assert 'href="index (3).html"' in index
+        assert 'Agent Audit - index<' in bundle.read('index (3).html').decode()
@@ -0,0 +1,19 @@
+import pandas as pd
+
+from audit_engine import prepare_combined, prepare_dataset
+from call_log_generator import make_call_log
+
+
+def test_keeps_repeats_within_an_export_and_drops_repeats_across_exports():
+    first = make_call_log(500, seed=1, extra_columns=False, call_ids=True)
+    first = pd.concat([first, first.iloc[:20]], ignore_index=True)  # listed twice in one export
+    second = pd.concat([make_call_log(300, seed=2, extra_columns=False, call_ids=True), first.iloc[100:150]],
+                       ignore_index=True)
+
+    dataset = prepare_combined([first.copy(), second.copy()])
+    assert len(dataset.df) == 520 + 300
+    assert list(dataset.source_rows) == [520, 300]
+    # The first export counts exactly as it does on its own
+    alone = prepare_dataset(first.copy())
+    for column in ['Phone Number', 'Flags']:
+        assert dataset.df[column].iloc[:520].astype(str).tolist() == alone.df[column].astype(str).tolist()
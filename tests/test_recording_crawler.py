@@ -0,0 +1,119 @@
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+
+from recording_crawler import iter_recordings
+
+HEADERS = ['Agent', 'Length', 'Recording']
+
+
+class FakeElement:
+    """Element of one rendering of a FakeListing page; stale once the page changes"""
+
+    def __init__(self, listing, attrs=None, text='', cells=None):
+        self.listing = listing
+        self.render = listing.render
+        self.attrs = attrs or {}
+        self.text = text
+        self.cells = cells
+
+    def _check(self):
+        if self.render != self.listing.render:
+            raise StaleElementReferenceException('stale element')
+
+    def is_enabled(self):
+        self._check()
+        return True
+
+    def is_displayed(self):
+        self._check()
+        return True
+
+    def get_attribute(self, name):
+        self._check()
+        return self.attrs.get(name)
+
+    def find_element(self, by, value):
+        if self.cells is None:
+            raise NoSuchElementException(value)
+        return FakeElement(self.listing, cells=self.cells)  # the link's table row
+
+    def find_elements(self, by, value):
+        return [FakeElement(self.listing, text=text) for text in self.cells or []]
+
+    def click(self):
+        self._check()
+        self.listing.clicks += 1
+        self.listing.page = (self.listing.page + 1) % len(self.listing.pages)
+        self.listing.render += 1
+
+
+class FakeListing:
+    """Stand-in Selenium driver for a paginated recordings table
+
+    pages is a list of pages, each a list of (agent, url) rows. The next-page
+    control is shown on every page but the last, or on every page when wrap is
+    set, in which case it leads from the last page back to the first.
+    """
+
+    def __init__(self, pages, wrap=False):
+        self.pages = pages
+        self.wrap = wrap
+        self.page = 0
+        self.render = 0
+        self.clicks = 0
+
+    def get(self, url):
+        self.page = 0
+        self.render += 1
+
+    def execute_script(self, script, *args):
+        return 'complete'
+
+    def find_elements(self, by, selector):
+        rows = self.pages[self.page]
+        if selector == "a[href$='.mp3']":
+            links = []
+            for i, (agent, url) in enumerate(rows):
+                link = FakeElement(self, {'href': url})
+                link.cells = [agent, f'{i}s', 'Download']
+                links.append(link)
+            return links
+        if selector == 'table thead th':
+            return [FakeElement(self, text=header) for header in HEADERS]
+        if self.wrap or self.page < len(self.pages) - 1:
+            return [FakeElement(self, {'class': 'next'})]
+        return []
+
+
+PAGES = [
+    [('Ana', 'http://portal/1.mp3'), ('Ben', 'http://portal/2.mp3')],
+    [('Cy', 'http://portal/3.mp3')],
+    [('Dee', 'http://portal/4.mp3')],
+]
+
+
+def test_walks_every_page_and_stops_on_the_last():
+    driver = FakeListing(PAGES)
+    recordings = list(iter_recordings(driver, 'http://portal/list', timeout=1))
+    assert [r['url'] for r in recordings] == [f'http://portal/{i}.mp3' for i in range(1, 5)]
+    assert [r['page'] for r in recordings] == [1, 1, 2, 3]
+    assert recordings[1] == {'Agent': 'Ben', 'Length': '1s', 'Recording': 'Download',
+                             'url': 'http://portal/2.mp3', 'page': 1}
+    assert driver.clicks == 2
+
+
+def test_stops_when_pagination_wraps_around():
+    driver = FakeListing(PAGES, wrap=True)
+    recordings = list(iter_recordings(driver, 'http://portal/list', timeout=1))
+    assert len(recordings) == 4
+    assert driver.clicks == 3
+
+
+def test_stops_at_max_pages():
+    driver = FakeListing(PAGES)
+    recordings = list(iter_recordings(driver, 'http://portal/list', timeout=1, max_pages=2))
+    assert [r['page'] for r in recordings] == [1, 1, 2]
+    assert driver.clicks == 1
+
+
+def test_empty_listing_yields_nothing():
+    assert list(iter_recordings(FakeListing([[]]), 'http://portal/list', timeout=0.5)) == []
@@ -0,0 +1,164 @@
+import os
+import re
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from recording_downloader import DOWNLOAD_CHUNK_BYTES, download_all, download_recording, file_sha256, make_session
+
+BODY = bytes(range(256)) * 10_000  # 2.4 MiB, several download chunks
+DROP_AFTER = 1_500_000
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    """Serves BODY at /rec/<name>.mp3 with Range support and scripted failures
+
+    failures maps a path to the responses its first requests get: an HTTP status,
+    'drop' (send DROP_AFTER bytes, then close the connection) or 'ignore-range'
+    (answer a Range request with the whole file).
+    """
+
+    requests = []
+    failures = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        RecordingHandler.requests.append((self.path, self.headers.get('Range')))
+        scripted = RecordingHandler.failures.get(self.path, [])
+        failure = scripted.pop(0) if scripted else None
+        if not self.path.startswith('/rec/'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        if isinstance(failure, int):
+            self.send_response(failure)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start = 0
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        if match and failure != 'ignore-range':
+            start = int(match.group(1))
+            if start >= len(BODY):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(BODY)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(BODY) - 1}/{len(BODY)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY) - start))
+        self.end_headers()
+        if failure == 'drop':
+            self.wfile.write(BODY[start:start + DROP_AFTER])
+            self.wfile.flush()
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(BODY[start:])
+
+
+@pytest.fixture
+def server(serve):
+    RecordingHandler.requests = []
+    RecordingHandler.failures = {}
+    return serve(RecordingHandler)
+
+
+def download(server, tmp_path, name='call.mp3', **kwargs):
+    return download_recording(make_session(), f'{server}/rec/{name}', str(tmp_path), backoff=0.01, **kwargs)
+
+
+def test_downloads_into_place(server, tmp_path):
+    result = download(server, tmp_path)
+    assert result['status'] == 'downloaded'
+    assert (tmp_path / 'call.mp3').read_bytes() == BODY
+    assert not (tmp_path / 'call.mp3.part').exists()
+    assert result['bytes'] == len(BODY)
+    assert result['sha256'] == file_sha256(str(tmp_path / 'call.mp3'))
+
+
+def test_resumes_part_file_with_range_request(server, tmp_path):
+    (tmp_path / 'call.mp3.part').write_bytes(BODY[:120_000])
+    result = download(server, tmp_path)
+    assert result['status'] == 'downloaded'
+    assert RecordingHandler.requests == [('/rec/call.mp3', 'bytes=120000-')]
+    assert (tmp_path / 'call.mp3').read_bytes() == BODY
+
+
+def test_416_means_part_file_is_already_complete(server, tmp_path):
+    (tmp_path / 'call.mp3.part').write_bytes(BODY)
+    result = download(server, tmp_path)
+    assert result['status'] == 'downloaded'
+    assert RecordingHandler.requests == [('/rec/call.mp3', f'bytes={len(BODY)}-')]
+    assert (tmp_path / 'call.mp3').read_bytes() == BODY
+
+
+def test_retries_server_errors(server, tmp_path):
+    RecordingHandler.failures['/rec/call.mp3'] = [503, 500]
+    result = download(server, tmp_path)
+    assert result['status'] == 'downloaded'
+    assert len(RecordingHandler.requests) == 3
+    assert (tmp_path / 'call.mp3').read_bytes() == BODY
+
+
+def test_gives_up_after_retries(server, tmp_path):
+    RecordingHandler.failures['/rec/call.mp3'] = [503] * 3
+    result = download(server, tmp_path, retries=3)
+    assert result['status'] == 'failed'
+    assert '503' in result['error']
+    assert len(RecordingHandler.requests) == 3
+    assert not (tmp_path / 'call.mp3').exists()
+
+
+def test_client_errors_are_not_retried(server, tmp_path):
+    RecordingHandler.failures['/rec/call.mp3'] = [403]
+    result = download(server, tmp_path)
+    assert result['status'] == 'failed'
+    assert len(RecordingHandler.requests) == 1
+
+
+def test_dropped_connection_resumes_where_it_stopped(server, tmp_path):
+    RecordingHandler.failures['/rec/call.mp3'] = ['drop']
+    result = download(server, tmp_path)
+    assert result['status'] == 'downloaded'
+    first, second = [header for _, header in RecordingHandler.requests]
+    # Whole chunks received before the drop are kept and not fetched again
+    assert first is None
+    assert second == f'bytes={DOWNLOAD_CHUNK_BYTES}-'
+    assert (tmp_path / 'call.mp3').read_bytes() == BODY
+
+
+def test_server_ignoring_range_restarts_the_file(server, tmp_path):
+    (tmp_path / 'call.mp3.part').write_bytes(b'x' * 5000)
+    RecordingHandler.failures['/rec/call.mp3'] = ['ignore-range']
+    result = download(server, tmp_path)
+    assert result['status'] == 'downloaded'
+    assert (tmp_path / 'call.mp3').read_bytes() == BODY
+
+
+def test_existing_file_is_skipped(server, tmp_path):
+    (tmp_path / 'call.mp3').write_bytes(BODY)
+    result = download(server, tmp_path)
+    assert result['status'] == 'skipped'
+    assert RecordingHandler.requests == []
+
+
+def test_download_all_reports_bad_rows_without_aborting(server, tmp_path):
+    recordings = [
+        {'url': f'{server}/rec/a.mp3', 'Agent': 'A'},
+        {'url': f'{server}/', 'Agent': 'B'},  # no file name in the link
+        {'url': f'{server}/rec/a.mp3', 'Agent': 'A'},  # listed twice
+        f'{server}/rec/b.mp3',
+    ]
+    seen = []
+    results = download_all(make_session(), recordings, str(tmp_path), concurrency=2, progress=seen.append,
+                           backoff=0.01)
+    assert [result['status'] for result in results] == ['downloaded', 'failed', 'downloaded']
+    assert results[0]['Agent'] == 'A'
+    assert 'No file name' in results[1]['error']
+    assert len(seen) == 3
+    assert sorted(os.listdir(tmp_path)) == ['a.mp3', 'b.mp3']
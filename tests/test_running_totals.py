@@ -0,0 +1,19 @@
+import pandas as pd
+
+from audit_engine import prepare_dataset
+from call_log_generator import make_call_log
+from history_store import RunningTotals
+
+
+def test_fold_counts_calls_repeated_within_an_export(tmp_path):
+    df = make_call_log(2000, agents=10, campaigns=3, extra_columns=False)
+    dead = pd.DataFrame({'Agent Name': 'Ahmed 0', 'Current campaign': 'Campaign 0', 'Disposition': 'Dead Call',
+                         'Recording Length (Seconds)': pd.array([pd.NA] * 5, dtype='Int64'), 'Phone Number': None})
+    df = pd.concat([df, df.iloc[:50], dead], ignore_index=True)  # redials and dead calls without phone or length
+    dataset = prepare_dataset(df)
+
+    totals = RunningTotals(str(tmp_path / 'totals.sqlite'))
+    assert totals.fold(dataset.df) == (len(df), 0)
+    assert totals.fold(dataset.df) == (0, len(df))
+    summary = totals.dataset().agent_summary()
+    pd.testing.assert_frame_equal(summary, dataset.agent_summary(), check_dtype=False, check_categorical=False)
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from audit_engine import SORT_COLUMNS, prepare_dataset, stream_dataset
+from call_log_generator import write_call_log
+from data_loader import read_chunked, read_dataset
+from export_store import export_frames
+
+COLUMNS = ['Agent Name', 'Disposition', 'Recording Length (Formatted)', 'Phone Number']
+
+
+@pytest.fixture(scope='module')
+def datasets(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('calls') / 'calls.csv')
+    write_call_log(path, 30_000, agents=20, campaigns=4)
+    return read_dataset(path, prepare_dataset), read_chunked(path, stream_dataset, block_bytes=300_000)
+
+
+@pytest.mark.parametrize('sort_by', [None, *SORT_COLUMNS.values()])
+@pytest.mark.parametrize('phone', [None, '12'])
+def test_streamed_pages_match_in_memory(datasets, sort_by, phone):
+    full, streamed = datasets
+    agent = full.df['Agent Name'].cat.categories[2]
+    for agent_filter, campaign_filter in [(None, None), (agent, None), (agent, 'Campaign 1')]:
+        assert streamed.flagged_total(agent_filter, campaign_filter, phone) == \
+            full.flagged_total(agent_filter, campaign_filter, phone)
+        for descending in (False, True):
+            for start in (0, 130):
+                args = (agent_filter, campaign_filter, sort_by, descending, phone, start, 100, COLUMNS)
+                pd.testing.assert_frame_equal(streamed.flagged_page(*args), full.flagged_page(*args),
+                                              check_index_type=False)
+
+
+def test_streamed_export_matches_in_memory(datasets):
+    full, streamed = datasets
+    assert type(streamed).__name__ == 'StreamedDataset'
+    pd.testing.assert_frame_equal(pd.concat(export_frames(streamed, chunk_rows=777)), pd.concat(export_frames(full)),
+                                  check_index_type=False)
+    pd.testing.assert_frame_equal(streamed.agent_summary(), full.agent_summary())